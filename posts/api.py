@@ -0,0 +1,279 @@
+"""
+JSON API для чтения лент.
+
+Ленты index, группы, профиля и подписок и пост с комментариями отдаются
+компактным JSON с курсорной пагинацией (?after=). У каждого ответа есть
+сильный ETag из данных области, а не из версий в кэше (с LocMemCache они
+у каждого воркера свои): последнего updated и числа постов, последнего id
+и числа комментариев и последнего updated групп (slug группы есть в
+ответе). Вставка, правка и удаление строки меняют хотя бы одно из них,
+поэтому на If-None-Match с тем же ETag отвечаем 304 после пары
+агрегатных запросов, не выполняя запросов к ленте. Агрегаты читаются из
+default: отстающая реплика дала бы старый ETag.
+
+ETag ленты подписок строится из id и updated постов её страницы и
+комментариев к ним — агрегат по всей ленте подписчика был бы дороже.
+
+Единственная запись — follow_bulk: подписка и отписка пачкой (см.
+posts/follows.py).
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import (condition, require_POST,
+                                          require_safe)
+
+from . import follows, suggestions
+from .models import Comment, Follow, FollowSuggestion, Group, Post, User
+from .paginators import CursorPaginator, InvalidCursor
+
+FEED_ORDERING = ("-pub_date", "-id")
+FOLLOW_ORDERING = ("-feed_date", "-id")
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={
+        "ensure_ascii": False, "separators": (",", ":")})
+
+
+def _not_found():
+    return _json({"detail": "Не найдено."}, status=404)
+
+
+def _unauthorized():
+    return _json({"detail": "Требуется авторизация."}, status=401)
+
+
+def _bad_request(detail):
+    return _json({"detail": detail}, status=400)
+
+
+def post_data(post):
+    return {
+        "id": post.id,
+        "author": post.author.username,
+        "group": post.group.slug if post.group_id else None,
+        "text": post.text,
+        "pub_date": post.pub_date,
+        "updated": post.updated,
+        "image": post.image.url if post.image else None,
+        "comment_count": post.comment_count,
+        "url": reverse("post", args=[post.author.username, post.id]),
+    }
+
+
+def comment_data(comment):
+    return {
+        "id": comment.id,
+        "author": comment.author.username,
+        "text": comment.text,
+        "created": comment.created,
+    }
+
+
+def _page(request, queryset, ordering=FEED_ORDERING):
+    paginator = CursorPaginator(queryset, settings.API_PAGE_SIZE,
+                                ordering=ordering)
+    return paginator.get_page(after=request.GET.get("after"), strict=True)
+
+
+def _feed(request, queryset, ordering=FEED_ORDERING):
+    page = _page(request, queryset, ordering)
+    return _json({"results": [post_data(post) for post in page],
+                  "next": page.next_cursor})
+
+
+def _posts_state(posts):
+    return tuple(posts.using("default").order_by().aggregate(
+        updated=Max("updated"), count=Count("id")).values())
+
+
+def _comments_state(comments):
+    return tuple(comments.using("default").aggregate(
+        last=Max("id"), count=Count("id")).values())
+
+
+def _groups_state():
+    return Group.objects.using("default").aggregate(
+        updated=Max("updated"))["updated"]
+
+
+def _index_state():
+    return (_posts_state(Post.objects.all()),
+            _comments_state(Comment.objects.all()), _groups_state())
+
+
+def _group_state(slug):
+    group = Group.objects.using("default").filter(slug=slug).values_list(
+        "id", "updated").first()
+    return (group, _posts_state(Post.objects.filter(group__slug=slug)),
+            _comments_state(Comment.objects.filter(post__group__slug=slug)))
+
+
+def _profile_state(username):
+    author = User.objects.using("default").filter(
+        username=username).values_list("id", flat=True).first()
+    return (author, _posts_state(Post.objects.filter(author_id=author)),
+            _comments_state(Comment.objects.filter(post__author_id=author)),
+            _groups_state())
+
+
+def _post_state(post_id):
+    post = Post.objects.using("default").filter(pk=post_id).values_list(
+        "updated", "group__updated").first()
+    return post, _comments_state(Comment.objects.filter(post_id=post_id))
+
+
+def _etag(request, *state):
+    """ETag из адреса запроса и состояния данных ответа."""
+    data = [request.get_full_path(), *state]
+    return hashlib.md5(repr(data).encode()).hexdigest()
+
+
+def from_state(get_state):
+    """ETag по состоянию get_state(**kwargs) данных ответа."""
+    def etag(request, *args, **kwargs):
+        return _etag(request, get_state(*args, **kwargs))
+    return etag
+
+
+def api_view(etag, private=False):
+    """
+    Оборачивает представление API: только GET/HEAD, условный ответ по
+    etag(request, **kwargs) и заголовки, по которым клиент всегда сверяет
+    свою копию с сервером. Подделанный курсор ?after= — ответ 400.
+    """
+    def decorator(view):
+        conditional = condition(etag_func=etag)(view)
+
+        @wraps(view)
+        @require_safe
+        def wrapper(request, *args, **kwargs):
+            if private and not request.user.is_authenticated:
+                return _unauthorized()
+            try:
+                response = conditional(request, *args, **kwargs)
+            except InvalidCursor as error:
+                response = _bad_request(str(error))
+            patch_cache_control(response, no_cache=True, private=private)
+            if private:
+                patch_vary_headers(response, ("Cookie",))
+            return response
+        return wrapper
+    return decorator
+
+
+@api_view(from_state(_index_state))
+def index(request):
+    return _feed(request, Post.objects.for_feed())
+
+
+@api_view(from_state(_group_state))
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return _not_found()
+    return _feed(request, group.posts.for_feed())
+
+
+@api_view(from_state(_profile_state))
+def profile(request, username):
+    author = User.objects.filter(username=username).first()
+    if author is None:
+        return _not_found()
+    return _feed(request, author.posts.for_feed())
+
+
+@api_view(from_state(_post_state))
+def post_view(request, post_id):
+    post = Post.objects.for_feed().filter(id=post_id).first()
+    if post is None:
+        return _not_found()
+    paginator = CursorPaginator(
+        Comment.objects.filter(post_id=post.id).select_related("author"),
+        settings.API_PAGE_SIZE, ordering=("created", "id"))
+    comments = paginator.get_page(after=request.GET.get("after"),
+                                  strict=True)
+    return _json({**post_data(post),
+                  "comments": [comment_data(c) for c in comments],
+                  "next": comments.next_cursor})
+
+
+def _follow_posts(user):
+    return Post.objects.filter(feed_entries__user=user).\
+        annotate(feed_date=F("feed_entries__pub_date"))
+
+
+def _follow_etag(request):
+    """Посты текущей страницы ленты подписок и комментарии к ним."""
+    page = _page(request, _follow_posts(request.user).using("default").
+                 only("id", "updated"), FOLLOW_ORDERING)
+    posts = [(post.id, post.updated) for post in page]
+    comments = _comments_state(Comment.objects.filter(
+        post_id__in=[post_id for post_id, _ in posts]))
+    return _etag(request, posts, page.has_next(), comments, _groups_state())
+
+
+@api_view(_follow_etag, private=True)
+def follow_index(request):
+    return _feed(request, _follow_posts(request.user).for_feed(),
+                 FOLLOW_ORDERING)
+
+
+def _suggestions_etag(request):
+    """Подписки пользователя и состояние его рекомендаций."""
+    follows = Follow.objects.using("default").filter(
+        user=request.user).aggregate(count=Count("id"), last=Max("id"))
+    state = FollowSuggestion.objects.using("default").filter(
+        user=request.user).aggregate(count=Count("id"), last=Max("id"))
+    return _etag(request, tuple(follows.values()), tuple(state.values()))
+
+
+@api_view(_suggestions_etag, private=True)
+def follow_suggestions(request):
+    return _json({"results": [
+        {"username": suggestion.author.username,
+         "score": suggestion.score,
+         "url": reverse("profile", args=[suggestion.author.username])}
+        for suggestion in suggestions.for_user(request.user)
+    ]})
+
+
+def _usernames(data, key):
+    usernames = data.get(key, [])
+    if not isinstance(usernames, list) or not all(
+            isinstance(name, str) for name in usernames):
+        raise ValueError(key)
+    return usernames
+
+
+@require_POST
+def follow_bulk(request):
+    """
+    Подписка и отписка пачкой: тело {"follow": [...], "unfollow": [...]}
+    с именами авторов. Ошибка в любом имени отменяет весь запрос.
+    """
+    if not request.user.is_authenticated:
+        return _unauthorized()
+    try:
+        data = json.loads(request.body)
+        follow = _usernames(data, "follow")
+        unfollow = _usernames(data, "unfollow")
+    except (ValueError, AttributeError):
+        return _json({"detail": "Ожидается JSON со списками имён "
+                                "follow и unfollow."}, status=400)
+    try:
+        with transaction.atomic():
+            followed = follows.follow_many(request.user, follow)
+            unfollowed = follows.unfollow_many(request.user, unfollow)
+    except follows.FollowError as error:
+        return _json({"detail": str(error), "usernames": error.usernames},
+                     status=400)
+    return _json({"followed": followed, "unfollowed": unfollowed})
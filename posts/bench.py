@@ -0,0 +1,152 @@
+"""
+Общие помощники бенчмарков: наполнение базы и замер времени.
+
+Сиды пишутся в текущую базу из DATABASES["default"], поэтому запускать
+бенчмарки нужно на отдельном файле, например
+YATUBE_DB_NAME=/tmp/bench.sqlite3 python manage.py migrate.
+"""
+import datetime as dt
+import io
+import random
+import statistics
+import time
+
+from PIL import Image
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from . import feed
+from .bulk import batched, preserve_dates
+from .models import Comment, Follow, Group, Post, User
+
+BENCH_PREFIX = "bench"
+READER = "bench_reader"
+
+# Словарь текстов постов; частоты слов убывают по закону Ципфа, как в
+# живом тексте, чтобы поиск видел и редкие, и очень частые слова
+WORDS = """
+    день город жизнь работа человек время дорога дом утро вечер книга
+    музыка фотография путешествие кошка собака море горы лес река погода
+    новости проект программа разработка питон джанго база запрос индекс
+    кэш сервер страница лента подписка комментарий автор группа история
+    праздник друзья семья кофе чай завтрак обед ужин спорт футбол бег
+    велосипед зима весна лето осень снег дождь солнце ветер облака звёзды
+    красивый новый старый быстрый медленный интересный важный простой
+    сложный тёплый холодный гулял читал писал смотрел слушал готовил
+""".split()
+WORD_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+# Сколько разных файлов картинок делят между собой посты с картинками
+IMAGE_FILES = 10
+
+
+def make_images(count, rnd):
+    """Картинки-заглушки в MEDIA_ROOT/posts/; возвращает их имена."""
+    names = []
+    for number in range(count):
+        name = f"posts/{BENCH_PREFIX}_{number}.jpg"
+        if not default_storage.exists(name):
+            color = tuple(rnd.randrange(256) for _ in range(3))
+            buffer = io.BytesIO()
+            Image.new("RGB", (1280, 960), color).save(buffer, "JPEG")
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+        names.append(name)
+    return names
+
+
+def seed(users=1000, posts=1_000_000, groups=50, comments=100_000,
+         follows=50, images=0, batch_size=10_000, random_seed=1,
+         stdout=None):
+    """
+    Наполняет базу равномерными синтетическими данными; images постов
+    получают картинку из IMAGE_FILES общих файлов.
+    """
+    rnd = random.Random(random_seed)
+    password = make_password(None)
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    User.objects.bulk_create(
+        [User(username=f"{BENCH_PREFIX}{i}", password=password)
+         for i in range(users)] + [User(username=READER, password=password)],
+        ignore_conflicts=True,
+    )
+    user_ids = list(User.objects.filter(
+        username__startswith=BENCH_PREFIX).exclude(username=READER).
+        values_list("id", flat=True))
+    reader = User.objects.get(username=READER)
+    Group.objects.bulk_create(
+        [Group(title=f"{BENCH_PREFIX} {i}", slug=f"{BENCH_PREFIX}-{i}",
+               description="") for i in range(groups)],
+        ignore_conflicts=True,
+    )
+    group_ids = list(Group.objects.filter(
+        slug__startswith=BENCH_PREFIX).values_list("id", flat=True))
+    log(f"Пользователей: {len(user_ids)}, групп: {len(group_ids)}")
+
+    now = timezone.now()
+    span = dt.timedelta(days=365).total_seconds()
+    image_names = make_images(min(images, IMAGE_FILES), rnd) if images \
+        else []
+
+    def make_posts():
+        for i in range(posts):
+            pub_date = now - dt.timedelta(seconds=span * (1 - i / posts))
+            yield Post(
+                text=" ".join(rnd.choices(WORDS, WORD_WEIGHTS,
+                                          k=rnd.randint(5, 30))),
+                author_id=rnd.choice(user_ids),
+                group_id=rnd.choice(group_ids) if rnd.random() < 0.7
+                else None,
+                pub_date=pub_date,
+                updated=pub_date,
+                image=rnd.choice(image_names)
+                if image_names and rnd.random() < images / posts else None,
+            )
+
+    with preserve_dates(Post, Comment):
+        for number, chunk in enumerate(batched(make_posts(), batch_size)):
+            Post.objects.bulk_create(chunk)
+            log(f"Постов: {(number + 1) * batch_size}")
+        post_ids = Post.objects.values_list("id", flat=True)
+        first_id, last_id = post_ids.order_by("id").first(), \
+            post_ids.order_by("-id").first()
+        for chunk in batched(range(comments), batch_size):
+            Comment.objects.bulk_create([
+                Comment(post_id=rnd.randint(first_id, last_id),
+                        author_id=rnd.choice(user_ids),
+                        text="Тестовый комментарий", created=now)
+                for _ in chunk
+            ])
+        log(f"Комментариев: {comments}")
+
+    Follow.objects.bulk_create([
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids + [reader.id]
+        for author_id in rnd.sample(user_ids, min(follows, len(user_ids)))
+        if author_id != user_id
+    ], ignore_conflicts=True)
+    feed.rebuild([reader.id])
+    log(f"Подписок на пользователя: {follows}")
+    return reader
+
+
+def measure(func, repeat=5):
+    """Медиана и минимум времени выполнения в миллисекундах."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+
+def percentile(values, share):
+    """Значение, ниже которого лежит доля share замеров; None без замеров."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
@@ -0,0 +1,34 @@
+"""Вспомогательные функции для массовых вставок (сиды, импорт, бенчмарки)."""
+from contextlib import contextmanager
+from itertools import islice
+
+
+def batched(iterable, size):
+    """Делит поток на списки длиной size, не держа весь поток в памяти."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def preserve_dates(*models):
+    """
+    Отключает auto_now/auto_now_add, чтобы bulk_create сохранил даты
+    из объектов, а не текущее время.
+    """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False)
+        or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
@@ -0,0 +1,183 @@
+"""
+Версионированный кэш страниц.
+
+У каждой области (лента index, группа, профиль, пост, лента подписок)
+есть счётчик версии в кэше. Сигналы сохранения и удаления Post, Comment,
+Follow, Group и User увеличивают версии затронутых областей, а ключ
+закэшированной страницы включает текущие версии, поэтому устаревшие
+страницы больше не читаются и вытесняются по TTL. Одновременные промахи по одному ключу
+объединяются: страницу строит один процесс, остальные ждут результат.
+
+Ключ страницы служит и её ETag: если у браузера или CDN уже есть
+страница с тем же ключом (If-None-Match), отвечаем 304 до запроса к кэшу
+и базе. Это верно, только когда версии общие для всех процессов: с
+LocMemCache у каждого воркера свои счётчики, и правка в одном процессе не
+меняет ETag в другом. Поэтому ETag и 304 отдаются только при PAGE_ETAGS
+(по умолчанию включено для общего бэкенда кэша). Cache-Control: no-cache
+заставляет каждый раз сверять копию, для гостей ответ public (его может
+хранить CDN), для сессий — private.
+
+Используются только get_many/add/incr/set, так что схема работает и с
+LocMemCache, и с общим бэкендом (memcached, redis, файловый кэш).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag
+from yatube import metrics
+from yatube.routers import current_replica
+
+from .models import Post
+
+VERSION_PREFIX = "version:"
+
+
+def _initial_version():
+    # Версия после вытеснения ключа должна быть новой, а не снова 1,
+    # иначе можно прочитать старую страницу с тем же номером версии.
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        version = found.get(key)
+        if version is None:
+            cache.add(key, _initial_version(), None)
+            version = cache.get(key)
+        versions.append(version)
+    return versions
+
+
+def bump(*scopes):
+    for scope in set(scopes):
+        key = VERSION_PREFIX + scope
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_version(), None)
+
+
+def bump_on_commit(*scopes):
+    """
+    Увеличивает версии сразу и ещё раз после коммита: иначе параллельный
+    запрос между двумя событиями мог бы закэшировать под новой версией
+    данные, которые ещё не закоммичены.
+    """
+    bump(*scopes)
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def post_scopes(post_id, username, group_slug):
+    scopes = ["index", f"profile:{username}", f"post:{post_id}"]
+    if group_slug:
+        scopes.append(f"group:{group_slug}")
+    return scopes
+
+
+def post_id_scopes(post_id):
+    """Области поста по его id (один запрос за автором и группой)."""
+    post = Post.objects.filter(pk=post_id).values(
+        "author__username", "group__slug").first()
+    if post is None:
+        return []
+    return post_scopes(post_id, post["author__username"], post["group__slug"])
+
+
+def variant(request):
+    """Вариант страницы: общий для гостей и отдельный для каждой сессии."""
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session:
+        return "anon"
+    return hashlib.md5(session.encode()).hexdigest()
+
+
+def page_key(request, scopes):
+    versions = ".".join(str(version) for version in get_versions(scopes))
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"page:{path}:{versions}:{variant(request)}"
+
+
+def page_etag(key):
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def _patch_headers(request, response):
+    patch_vary_headers(response, ("Cookie",))
+    if variant(request) == "anon":
+        patch_cache_control(response, public=True, no_cache=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+
+
+def _page_timeout():
+    """
+    Страница, собранная с отстающей реплики, могла не увидеть запись, из-за
+    которой сменилась версия, поэтому её держим не дольше окна
+    REPLICA_STICKY_SECONDS.
+    """
+    if current_replica():
+        return min(settings.PAGE_CACHE_TIMEOUT, settings.REPLICA_STICKY_SECONDS)
+    return settings.PAGE_CACHE_TIMEOUT
+
+
+def cache_versioned_page(get_scopes):
+    """
+    Кэширует GET-ответ представления под ключом с версиями областей.
+
+    get_scopes(request, **kwargs) возвращает список областей страницы.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            key = page_key(request, get_scopes(request, *args, **kwargs))
+            etag = None
+            if settings.PAGE_ETAGS:
+                etag = page_etag(key)
+                response = get_conditional_response(request, etag=etag)
+                if response is not None:
+                    response["ETag"] = etag
+                    _patch_headers(request, response)
+                    return response
+            response = cache.get(key)
+            metrics.record_cache(hits=response is not None,
+                                 misses=response is None)
+            if response is not None:
+                return response
+
+            lock = key + ":lock"
+            if not cache.add(lock, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+                deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    response = cache.get(key)
+                    if response is not None:
+                        return response
+                response = view(request, *args, **kwargs)
+                _patch_headers(request, response)
+                return response
+            try:
+                response = view(request, *args, **kwargs)
+                _patch_headers(request, response)
+                # Страница с отстающей реплики может не соответствовать
+                # версиям в ключе: такой ответ не получает ETag
+                if (etag and response.status_code == 200
+                        and not current_replica()):
+                    response["ETag"] = etag
+                if response.status_code == 200:
+                    cache.set(key, response, _page_timeout())
+            finally:
+                cache.delete(lock)
+            return response
+        return wrapper
+    return decorator
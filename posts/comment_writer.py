@@ -0,0 +1,364 @@
+"""
+Отложенная запись комментариев (write-behind), включается настройкой
+COMMENT_WRITE_BEHIND.
+
+В SQLite каждая вставка комментария берёт блокировку записи, и под
+наплывом комментариев к одному посту запросы ждут друг друга или падают
+с «database is locked». В этом режиме add_comment только проверяет форму,
+дописывает комментарий строкой JSON в журнал (COMMENT_JOURNAL, с fsync) и
+ставит его в очередь. Поток записи собирает очередь в пачки до
+COMMENT_BATCH_SIZE комментариев или за COMMENT_FLUSH_MS миллисекунд и
+вставляет каждую пачку одним bulk_create в одной транзакции.
+
+Сигналы при bulk_create не срабатывают, поэтому поток сам обновляет
+счётчики профилей, поисковый индекс и версии кэша постов. Позиция в
+журнале, до которой комментарии уже в базе, хранится в CommentJournal в
+той же транзакции. После падения процесса новый процесс дописывает в
+базу хвост журнала после этой позиции, и комментарий не теряется и не
+записывается дважды. Журналом владеет один процесс (flock); остальные
+процессы пишут комментарии как обычно, сразу в базу.
+
+Очередь ограничена COMMENT_QUEUE_SIZE. Если она полна дольше
+COMMENT_QUEUE_TIMEOUT секунд, комментарий не принимается (503 в
+представлении). Пока комментарий в очереди, автор видит его на странице
+поста (pending_for), а версия поста сбрасывается сразу при приёме.
+
+Дата комментария — время вставки в базу: при обычной работе оно
+отстаёт от приёма на доли секунды, а после падения процесса — на время
+до перезапуска.
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search, stats
+from .cache import bump, post_id_scopes
+from .models import Comment, CommentJournal, Post, User
+
+logger = logging.getLogger(__name__)
+
+# Журнал обнуляется, когда всё записано и он вырос больше этого размера
+ROTATE_BYTES = 1 << 20
+# Попыток записать пачку (например, пока база занята) и пауза между ними
+ATTEMPTS = 3
+RETRY_SECONDS = 1
+
+_STOP = object()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Journal:
+    """Файл JSON-строк только на дозапись; владелец держит flock."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.file = open(path, "a+b")
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.file.close()
+            raise
+        self._drop_torn_tail()
+
+    def _drop_torn_tail(self):
+        """Отрезает строку, дописанную не до конца при падении."""
+        self.file.seek(0)
+        data = self.file.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            self.file.truncate(end)
+
+    def size(self):
+        return os.fstat(self.file.fileno()).st_size
+
+    def append(self, record):
+        """Дописывает запись; возвращает позицию её конца."""
+        line = json.dumps(record, ensure_ascii=False).encode() + b"\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            return self.file.tell()
+
+    def read_from(self, offset):
+        """[(запись, позиция конца)] после offset."""
+        with self.lock:
+            self.file.seek(offset)
+            lines = self.file.read().splitlines(keepends=True)
+        records = []
+        for line in lines:
+            offset += len(line)
+            records.append((json.loads(line), offset))
+        return records
+
+    def close(self):
+        self.file.close()
+
+
+def _bump_posts(post_ids):
+    bump(*(scope for post_id in post_ids
+           for scope in post_id_scopes(post_id)))
+
+
+def _save_checkpoint(path, offset):
+    CommentJournal.objects.update_or_create(path=path,
+                                            defaults={"offset": offset})
+
+
+class CommentWriter:
+    def __init__(self, path, start=True):
+        self.journal = Journal(path, fsync=settings.COMMENT_JOURNAL_FSYNC)
+        self.queue = queue.Queue()
+        self.slots = threading.BoundedSemaphore(settings.COMMENT_QUEUE_SIZE)
+        # Журнал и очередь пополняются под одной блокировкой: порядок
+        # очереди совпадает с порядком журнала, и позиция последней
+        # записанной пачки — граница, до которой записано всё
+        self.submit_lock = threading.Lock()
+        self.overlay_lock = threading.Lock()
+        self.overlay = defaultdict(list)
+        self.thread = None
+        try:
+            self.replay()
+        except Exception:
+            self.journal.close()
+            raise
+        if start:
+            self.thread = threading.Thread(target=self._run, daemon=True,
+                                           name="comment-writer")
+            self.thread.start()
+
+    def replay(self):
+        """Записывает в базу хвост журнала после контрольной точки."""
+        checkpoint = CommentJournal.objects.filter(
+            path=self.journal.path).first()
+        offset = checkpoint.offset if checkpoint else 0
+        if offset > self.journal.size():
+            # Журнал обнулили, а точку сбросить не успели
+            offset = 0
+        records = self.journal.read_from(offset)
+        post_ids = set()
+        for start in range(0, len(records), settings.COMMENT_BATCH_SIZE):
+            post_ids |= self._write_safely(
+                records[start:start + settings.COMMENT_BATCH_SIZE])
+        _bump_posts(post_ids)
+        if records:
+            logger.warning("Из журнала %s дописано комментариев: %s",
+                           self.journal.path, len(records))
+        return len(records)
+
+    def submit(self, post_id, author, text):
+        """Принимает комментарий; QueueFull, если очередь не освободилась."""
+        if not self.slots.acquire(timeout=settings.COMMENT_QUEUE_TIMEOUT):
+            raise QueueFull
+        record = {"post_id": post_id, "author_id": author.id, "text": text}
+        comment = Comment(post_id=post_id, author=author, text=text,
+                          created=timezone.now())
+        with self.submit_lock:
+            offset = self.journal.append(record)
+            with self.overlay_lock:
+                self.overlay[post_id].append((offset, comment))
+            self.queue.put((record, offset))
+        _bump_posts([post_id])
+        return comment
+
+    def pending_for(self, post_id, user):
+        """Ещё не записанные комментарии user к посту."""
+        with self.overlay_lock:
+            return [comment for _, comment in self.overlay.get(post_id, ())
+                    if comment.author_id == user.id]
+
+    def _write(self, batch):
+        """
+        Вставляет пачку [(запись, позиция)] и сдвигает точку журнала;
+        возвращает id постов, к которым что-то записано.
+        """
+        existing = set(Post.objects.filter(
+            id__in={record["post_id"] for record, _ in batch}).
+            values_list("id", flat=True))
+        authors = set(User.objects.filter(
+            id__in={record["author_id"] for record, _ in batch}).
+            values_list("id", flat=True))
+        comments = [Comment(post_id=record["post_id"],
+                            author_id=record["author_id"],
+                            text=record["text"])
+                    for record, _ in batch
+                    if record["post_id"] in existing
+                    and record["author_id"] in authors]
+        if len(comments) < len(batch):
+            logger.warning("Пропущено комментариев к удалённым постам или "
+                           "от удалённых авторов: %s",
+                           len(batch) - len(comments))
+        with transaction.atomic():
+            Comment.objects.bulk_create(comments)
+            for author_id, count in Counter(
+                    comment.author_id for comment in comments).items():
+                stats.adjust(author_id, comments_count=count)
+            for comment in comments:
+                search.add_comment(comment.post_id, comment.text)
+            _save_checkpoint(self.journal.path, batch[-1][1])
+        return {comment.post_id for comment in comments}
+
+    def _write_safely(self, batch):
+        """
+        _write с повторами. Пачку, которая так и не записалась, пишет по
+        одной строке, а строку, которая не пишется ни с какой попытки,
+        пропускает с ошибкой в логе: иначе она навсегда остановила бы
+        очередь.
+        """
+        for attempt in range(ATTEMPTS):
+            try:
+                return self._write(batch)
+            except Exception:
+                logger.exception("Не удалось записать пачку из %s "
+                                 "комментариев (попытка %s)",
+                                 len(batch), attempt + 1)
+                connection.close()
+                if attempt + 1 < ATTEMPTS:
+                    time.sleep(RETRY_SECONDS)
+        if len(batch) > 1:
+            post_ids = set()
+            for item in batch:
+                post_ids |= self._write_safely([item])
+            return post_ids
+        record, offset = batch[0]
+        logger.error("Комментарий пропущен: %s", record)
+        _save_checkpoint(self.journal.path, offset)
+        return set()
+
+    def _written(self, batch, post_ids):
+        """
+        Убирает записанное из видимого автору и только потом сбрасывает
+        версии: иначе страницу могли бы закэшировать с комментарием и из
+        базы, и из очереди.
+        """
+        offsets = {offset for _, offset in batch}
+        with self.overlay_lock:
+            for post_id in {record["post_id"] for record, _ in batch}:
+                left = [item for item in self.overlay[post_id]
+                        if item[0] not in offsets]
+                if left:
+                    self.overlay[post_id] = left
+                else:
+                    del self.overlay[post_id]
+        _bump_posts(post_ids)
+        for _ in batch:
+            self.slots.release()
+        self._rotate(batch[-1][1])
+
+    def _rotate(self, offset):
+        with self.journal.lock:
+            size = self.journal.size()
+            if size < ROTATE_BYTES or offset != size:
+                return
+            # Сначала журнал, потом точка: точка за концом файла при
+            # чтении считается нулём
+            self.journal.file.truncate(0)
+            _save_checkpoint(self.journal.path, 0)
+
+    def _next_batch(self):
+        """Пачка из очереди или None, если пора остановиться."""
+        item = self.queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + settings.COMMENT_FLUSH_MS / 1000
+        while len(batch) < settings.COMMENT_BATCH_SIZE:
+            try:
+                item = self.queue.get(
+                    timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self.queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                connection.close()
+                return
+            try:
+                post_ids = self._write_safely(batch)
+            except Exception:
+                # База недоступна даже для точки журнала: строки
+                # пропускаются, чтобы очередь не встала
+                logger.exception("Пропущена пачка комментариев: %s",
+                                 [record for record, _ in batch])
+                post_ids = set()
+            self._written(batch, post_ids)
+
+    def flush(self):
+        """Записывает всё, что сейчас в очереди, в текущем потоке."""
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), settings.COMMENT_BATCH_SIZE):
+            part = batch[start:start + settings.COMMENT_BATCH_SIZE]
+            self._written(part, self._write_safely(part))
+
+    def stop(self, timeout=5):
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join(timeout)
+        self.journal.close()
+
+
+def get_writer():
+    """
+    Общий поток записи процесса или None, если режим выключен или
+    журналом владеет другой процесс.
+    """
+    global _writer
+    if not settings.COMMENT_WRITE_BEHIND:
+        return None
+    with _writer_lock:
+        if _writer is None:
+            try:
+                _writer = CommentWriter(settings.COMMENT_JOURNAL)
+            except OSError:
+                logger.warning("Журнал %s занят другим процессом, "
+                               "комментарии пишутся сразу",
+                               settings.COMMENT_JOURNAL)
+                _writer = False
+            except Exception:
+                # База недоступна: пишем сразу, журнал дочитаем при
+                # следующем запросе
+                logger.exception("Не удалось дописать журнал %s",
+                                 settings.COMMENT_JOURNAL)
+                return None
+            else:
+                atexit.register(_writer.stop)
+        return _writer or None
+
+
+def pending_for(post_id, user):
+    if not user.is_authenticated:
+        return []
+    writer = get_writer()
+    return writer.pending_for(post_id, user) if writer else []
@@ -0,0 +1,72 @@
+"""
+Материализованная лента подписок (fan-out on write).
+
+Каждый новый пост раскладывается по лентам подписчиков автора, поэтому
+страница follow_index читает готовую ленту одним проходом по индексу
+(user, -pub_date) вместо подзапроса по Follow.
+"""
+from django.db import transaction
+
+from .models import FeedEntry, Follow, Post
+
+BATCH_SIZE = 1000
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавляет пост в ленты всех подписчиков его автора."""
+    followers = Follow.objects.filter(author_id=post.author_id).\
+        values_list("user_id", flat=True)
+    _bulk_insert(
+        FeedEntry(user_id=user_id, post_id=post.id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя все посты автора после подписки."""
+    backfill_many(user_id, [author_id])
+
+
+def backfill_many(user_id, author_ids):
+    """То же для нескольких авторов одним запросом к постам."""
+    posts = Post.objects.filter(author_id__in=author_ids).\
+        values_list("id", "pub_date")
+    _bulk_insert(
+        FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты пользователя посты автора после отписки."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля; возвращает число подписок."""
+    follows = Follow.objects.all()
+    entries = FeedEntry.objects.all()
+    if user_ids is not None:
+        follows = follows.filter(user_id__in=user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+    count = 0
+    with transaction.atomic():
+        entries.delete()
+        for user_id, author_id in follows.values_list(
+                "user_id", "author_id").iterator():
+            backfill(user_id, author_id)
+            count += 1
+    return count
@@ -0,0 +1,83 @@
+"""
+Подписка и отписка сразу на многих авторов.
+
+Одиночная подписка идёт через сигналы Follow: на каждую строку отдельно
+заполняется лента и сдвигаются счётчики. follow_many вставляет все
+подписки одним bulk_create(ignore_conflicts=True) без сигналов и делает
+то же самое пачкой: одна выборка постов новых авторов для ленты, два
+UPDATE счётчиков и сброс версий кэша после коммита. Расхождения
+счётчиков при гонке двух одинаковых запросов исправит reconcile_stats.
+
+Отписка редка и идёт через обычное удаление (и сигналы), но в одной
+транзакции.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import feed, stats
+from .cache import bump_on_commit
+from .models import Follow, User
+
+
+class FollowError(ValueError):
+    """Запрос на подписку отклонён целиком; usernames — виновные имена."""
+
+    def __init__(self, message, usernames=()):
+        super().__init__(message)
+        self.usernames = list(usernames)
+
+
+def _authors(user, usernames):
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > settings.FOLLOW_BULK_LIMIT:
+        raise FollowError(
+            f"Не больше {settings.FOLLOW_BULK_LIMIT} авторов за раз")
+    authors = dict(User.objects.filter(username__in=usernames).
+                   values_list("username", "id"))
+    unknown = [name for name in usernames if name not in authors]
+    if unknown:
+        raise FollowError("Авторы не найдены", unknown)
+    authors.pop(user.username, None)
+    return authors
+
+
+def _bump(user, usernames):
+    bump_on_commit(f"profile:{user.username}", f"feed:{user.id}",
+                   *(f"profile:{name}" for name in usernames))
+
+
+def follow_many(user, usernames):
+    """
+    Подписывает user на авторов usernames; возвращает имена новых
+    подписок. Неизвестное имя или превышение FOLLOW_BULK_LIMIT —
+    FollowError, и ничего не меняется.
+    """
+    authors = _authors(user, usernames)
+    with transaction.atomic():
+        existing = set(Follow.objects.filter(
+            user=user, author_id__in=authors.values()).
+            values_list("author_id", flat=True))
+        new = {name: author_id for name, author_id in authors.items()
+               if author_id not in existing}
+        if not new:
+            return []
+        Follow.objects.bulk_create(
+            [Follow(user=user, author_id=author_id)
+             for author_id in new.values()], ignore_conflicts=True)
+        feed.backfill_many(user.id, list(new.values()))
+        stats.adjust(user.id, following_count=len(new))
+        stats.adjust_many(list(new.values()), followers_count=1)
+        _bump(user, new)
+    return sorted(new)
+
+
+def unfollow_many(user, usernames):
+    """Отписывает user от авторов usernames; возвращает имена отписок."""
+    authors = _authors(user, usernames)
+    with transaction.atomic():
+        follows = list(Follow.objects.filter(
+            user=user, author_id__in=authors.values()).
+            select_related("author", "user"))
+        for follow in follows:
+            follow.delete()
+    return sorted(follow.author.username for follow in follows)
@@ -1,9 +1,20 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+
 from .models import *
+from . import images
 from django import forms
 
 
 
 class PostForm(forms.ModelForm):
+    """
+    Картинка проверяется стандартным ImageField (Image.open читает только
+    заголовок, verify не декодирует пиксели), затем ограничиваются размер
+    файла и число пикселей, и только после этого картинка перекодируется.
+    """
     class Meta:
         model = Post
         fields = ["group", "text", "image"]
@@ -12,6 +23,39 @@ class PostForm(forms.ModelForm):
             "group": ("Выберите группу")
         }
 
+    def clean_image(self):
+        image = self.cleaned_data["image"]
+        if not isinstance(image, UploadedFile):
+            return image
+        self._check_upload_size(image)
+        width, height = image.image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                "Слишком большое разрешение изображения.",
+                code="too_many_pixels",
+            )
+        return images.normalize_upload(image)
+
+    def clean(self):
+        # Файл сверх лимита обработчик загрузки не сохраняет, поэтому
+        # ImageField сообщит о битой картинке; заменяем ошибку на понятную
+        upload = self.files.get("image")
+        if getattr(upload, "oversized", False):
+            self._errors.pop("image", None)
+            try:
+                self._check_upload_size(upload)
+            except ValidationError as error:
+                self.add_error("image", error)
+        return super().clean()
+
+    def _check_upload_size(self, upload):
+        limit = settings.POST_IMAGE_MAX_UPLOAD_SIZE
+        if getattr(upload, "oversized", False) or upload.size > limit:
+            raise ValidationError(
+                "Файл больше %(limit)s.", code="too_large",
+                params={"limit": filesizeformat(limit)},
+            )
+
 
 
 class CommentForm(forms.ModelForm):
@@ -0,0 +1,236 @@
+"""
+Генератор синтетических данных в масштабе продакшена.
+
+В отличие от bench.seed, данные неравномерны, как в живой сети:
+популярность пользователей подчиняется закону Ципфа, поэтому у первых
+по рангу авторов («знаменитостей») миллионы подписчиков и больше всего
+постов, а несколько «горячих» групп собирают большую часть постов.
+Комментарии чаще приходят к свежим постам.
+
+Строки строят процессы пула, а вставляет один процесс через bulk_create
+(SQLite всё равно пишет в один поток). Каждая пачка строится своим
+генератором случайных чисел с зерном (seed, вид, номер пачки), поэтому
+результат не зависит от числа процессов. В работе одновременно не больше
+WINDOW пачек на процесс, так что память не растёт с объёмом данных.
+"""
+import datetime as dt
+import itertools
+import math
+import multiprocessing
+import os
+import random
+from collections import deque
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import bench, feed, search, stats
+from .bulk import batched, preserve_dates
+from .models import Comment, Follow, Group, Post, User
+
+CHUNK_SIZE = 10_000
+# Пользователей в пачке подписок: у каждого их в среднем follows
+FOLLOW_CHUNK_SIZE = 500
+WINDOW = 2
+
+_config = {}
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def _rng(kind, chunk):
+    return random.Random(f"{_config['seed']}:{kind}:{chunk}")
+
+
+def _init(config):
+    _config.update(config)
+    _config["popularity"] = zipf_weights(len(config["user_ids"]),
+                                         config["follow_skew"])
+    _config["activity"] = zipf_weights(len(config["user_ids"]),
+                                       config["author_skew"])
+    _config["hotness"] = zipf_weights(len(config["group_ids"]),
+                                      config["group_skew"])
+    _config["words"] = list(itertools.accumulate(bench.WORD_WEIGHTS))
+
+
+def _text(rnd, low, high):
+    return " ".join(rnd.choices(bench.WORDS, cum_weights=_config["words"],
+                                k=rnd.randint(low, high)))
+
+
+def _post_rows(chunk):
+    """(id, автор, группа, текст, дата) для постов пачки по порядку."""
+    rnd = _rng("posts", chunk)
+    config = _config
+    users, groups = config["user_ids"], config["group_ids"]
+    start = chunk * CHUNK_SIZE
+    rows = []
+    for number in range(start, min(start + CHUNK_SIZE, config["posts"])):
+        author = rnd.choices(users, cum_weights=config["activity"])[0]
+        group = rnd.choices(groups, cum_weights=config["hotness"])[0] \
+            if groups and rnd.random() < config["group_share"] else None
+        date = config["start"] + config["span"] * number / config["posts"]
+        rows.append((config["first_post_id"] + number, author, group,
+                     _text(rnd, 5, 40), date))
+    return rows
+
+
+def _comment_rows(chunk):
+    """(пост, автор, текст, дата); свежие посты комментируют чаще."""
+    rnd = _rng("comments", chunk)
+    config = _config
+    users, posts = config["user_ids"], config["posts"]
+    start = chunk * CHUNK_SIZE
+    rows = []
+    for _ in range(start, min(start + CHUNK_SIZE, config["comments"])):
+        number = min(posts - 1, int(posts * rnd.random() ** 0.3))
+        date = config["start"] + config["span"] * number / posts
+        created = min(config["end"],
+                      date + dt.timedelta(seconds=rnd.randint(1, 86400)))
+        rows.append((config["first_post_id"] + number, rnd.choice(users),
+                     _text(rnd, 2, 15), created))
+    return rows
+
+
+def _follow_rows(chunk):
+    """
+    (подписчик, автор). Число подписок пользователя логнормально со
+    средним follows, авторы выбираются по популярности без повторов.
+    """
+    rnd = _rng("follows", chunk)
+    config = _config
+    users = config["user_ids"]
+    limit = min(len(users) - 1, config["max_follows"])
+    sigma = 1.0
+    mu = math.log(max(config["follows"], 1)) - sigma ** 2 / 2
+    start = chunk * FOLLOW_CHUNK_SIZE
+    rows = []
+    for number in range(start, min(start + FOLLOW_CHUNK_SIZE, len(users))):
+        count = min(limit, int(rnd.lognormvariate(mu, sigma)))
+        authors = set()
+        while len(authors) < count:
+            authors.update(
+                author for author in rnd.choices(
+                    users, cum_weights=config["popularity"],
+                    k=count - len(authors))
+                if author != users[number])
+        rows += [(users[number], author) for author in sorted(authors)]
+    return rows
+
+
+def _chunks(total, size=CHUNK_SIZE):
+    return range(math.ceil(total / size))
+
+
+def _imap(pool, func, chunks, window):
+    """Результаты по порядку, не больше window пачек в работе."""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(func, (chunk,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _insert(pool, func, chunks, window, stdout, label, save):
+    total = 0
+    for rows in _imap(pool, func, chunks, window):
+        with transaction.atomic():
+            save(rows)
+        total += len(rows)
+        if stdout is not None:
+            stdout.write(f"{label}: {total}")
+    return total
+
+
+def generate(users=100_000, posts=1_000_000, comments=3_000_000,
+             follows=50, max_follows=5000, groups=200, group_share=0.6,
+             follow_skew=1.1, author_skew=0.9, group_skew=1.3,
+             days=365, end=None, prefix="gen", seed=1, workers=None,
+             rebuild=True, stdout=None):
+    """
+    Генерирует данные за days дней до end (по умолчанию — до начала
+    текущих суток); возвращает число строк по моделям.
+    """
+    if min(posts, comments, follows, groups) < 0:
+        raise ValueError("Число строк не может быть отрицательным")
+    if users <= 0:
+        raise ValueError("Нужен хотя бы один пользователь")
+    if comments and posts <= 0:
+        raise ValueError("Для комментариев нужен хотя бы один пост")
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"Пользователи с префиксом {prefix!r} уже есть")
+    password = make_password(None)
+    # Одной транзакцией: после ошибки не останутся пользователи с
+    # префиксом, из-за которых повторный запуск откажется работать
+    with transaction.atomic():
+        for batch in batched(range(users), CHUNK_SIZE):
+            User.objects.bulk_create(
+                User(username=f"{prefix}{number}", password=password)
+                for number in batch)
+        Group.objects.bulk_create(
+            Group(title=f"Группа {prefix} {number}",
+                  slug=f"{prefix}-{number}", description="")
+            for number in range(groups))
+    end = end or timezone.now().replace(hour=0, minute=0, second=0,
+                                        microsecond=0)
+    config = {
+        "seed": seed, "posts": posts, "comments": comments,
+        "follows": follows, "max_follows": max_follows,
+        "group_share": group_share, "follow_skew": follow_skew,
+        "author_skew": author_skew, "group_skew": group_skew,
+        # Ранг популярности — порядок создания пользователей и групп
+        "user_ids": list(User.objects.filter(
+            username__startswith=prefix).order_by("id").
+            values_list("id", flat=True)),
+        "group_ids": list(Group.objects.filter(
+            slug__startswith=f"{prefix}-").order_by("id").
+            values_list("id", flat=True)),
+        "first_post_id": (Post.objects.aggregate(top=Max("id"))["top"]
+                          or 0) + 1,
+        "start": end - dt.timedelta(days=days),
+        "span": dt.timedelta(days=days),
+        "end": end,
+    }
+    totals = {"users": users, "groups": groups}
+    context = multiprocessing.get_context("fork")
+    workers = workers or os.cpu_count()
+    window = WINDOW * workers
+    with context.Pool(workers, initializer=_init, initargs=(config,)) as pool:
+        with preserve_dates(Post, Comment):
+            totals["posts"] = _insert(
+                pool, _post_rows, _chunks(posts), window, stdout, "Постов",
+                lambda rows: Post.objects.bulk_create(
+                    Post(id=id, author_id=author, group_id=group, text=text,
+                         pub_date=date, updated=date)
+                    for id, author, group, text, date in rows))
+            totals["comments"] = _insert(
+                pool, _comment_rows, _chunks(comments), window, stdout,
+                "Комментариев",
+                lambda rows: Comment.objects.bulk_create(
+                    Comment(post_id=post, author_id=author, text=text,
+                            created=date)
+                    for post, author, text, date in rows))
+        totals["follows"] = _insert(
+            pool, _follow_rows, _chunks(users, FOLLOW_CHUNK_SIZE), window,
+            stdout, "Подписок",
+            lambda rows: Follow.objects.bulk_create(
+                (Follow(user_id=user, author_id=author)
+                 for user, author in rows), ignore_conflicts=True))
+    if rebuild:
+        if stdout is not None:
+            stdout.write("Пересборка лент, счётчиков и поискового индекса")
+        feed.rebuild()
+        stats.reconcile()
+        search.rebuild()
+        cache.clear()
+    return totals
+
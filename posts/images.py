@@ -0,0 +1,104 @@
+"""
+Адаптивные варианты картинок постов.
+
+Для каждой картинки один раз строится набор ширин в WebP и JPEG с тем же
+кадрированием, что и у миниатюры карточки (960x339). Имена файлов
+детерминированы — posts/variants/<хэш содержимого>_<ширина>.<формат>, —
+поэтому их можно отдавать с бессрочным кэшированием. На посте хранится
+JSON с хэшем и построенными ширинами, из него шаблон собирает srcset.
+"""
+import hashlib
+import io
+import json
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+ASPECT = 339 / 960
+FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+           "jpg": ("JPEG", {"quality": 82, "optimize": True,
+                            "progressive": True})}
+
+
+# Форматы, которые перекодируются при загрузке; остальные (например,
+# анимированный GIF) сохраняются как есть
+UPLOAD_FORMATS = {"JPEG": {"quality": 90, "optimize": True},
+                  "PNG": {"optimize": True},
+                  "WEBP": {"quality": 90}}
+
+
+def normalize_upload(upload):
+    """
+    Поворачивает загруженную картинку по EXIF, уменьшает её до
+    POST_IMAGE_MAX_DIMENSION и перекодирует без метаданных. JPEG
+    декодируется сразу в уменьшенном масштабе (draft), поэтому в памяти не
+    бывает полноразмерного кадра. Результат пишется во временный файл.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    options = UPLOAD_FORMATS.get(image.format)
+    if options is None:
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    limit = settings.POST_IMAGE_MAX_DIMENSION
+    image.draft("RGB", (limit, limit))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = tempfile.TemporaryFile()
+    image.save(output, image_format, **options)
+    output.seek(0)
+    return File(output, name=upload.name)
+
+
+def variant_name(digest, width, extension):
+    return f"posts/variants/{digest}_{width}.{extension}"
+
+
+def _digest(image_name):
+    sha = hashlib.sha1()
+    with default_storage.open(image_name, "rb") as source:
+        for chunk in iter(lambda: source.read(64 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+def build_variants(image_name):
+    """Строит недостающие варианты и возвращает JSON для image_variants."""
+    digest = _digest(image_name)
+    with default_storage.open(image_name, "rb") as source:
+        image = Image.open(source)
+        largest = max(settings.POST_IMAGE_WIDTHS)
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    widths = [width for width in sorted(settings.POST_IMAGE_WIDTHS)
+              if width <= image.width] or [min(image.width, largest)]
+    for width in widths:
+        size = (width, max(1, round(width * ASPECT)))
+        resized = None
+        for extension, (image_format, options) in FORMATS.items():
+            name = variant_name(digest, width, extension)
+            if default_storage.exists(name):
+                continue
+            if resized is None:
+                resized = ImageOps.fit(image, size, Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, **options)
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+    return json.dumps({"digest": digest, "widths": widths})
+
+
+def srcset(variants, extension):
+    """Строка srcset из значения Post.image_variants."""
+    if not variants:
+        return ""
+    data = json.loads(variants)
+    return ", ".join(
+        f"{default_storage.url(variant_name(data['digest'], w, extension))} {w}w"
+        for w in data["widths"]
+    )
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from posts import bench
+from yatube.sqlite_cache import SQLiteCache
+
+
+def _private_memory():
+    """
+    Собственная память процесса в байтах. RSS не подходит: в него входят
+    общие страницы mmap файла кэша, которые физически одни на все процессы.
+    """
+    total = 0
+    with open("/proc/self/smaps_rollup") as smaps:
+        for line in smaps:
+            if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def _work(make_cache, number, options, barrier, results):
+    """
+    Воркер ведёт себя как процесс сервера: кладёт в кэш страницы, затем
+    читает их. Воркер 0 дополнительно сбрасывает «версию», а остальные
+    проверяют, видят ли они это изменение.
+    """
+    cache = make_cache()
+    rnd = random.Random(number)
+    value = "x" * options["value_size"]
+    keys = [f"page:{index}" for index in range(options["keys"])]
+    before = _private_memory()
+    for key in keys:
+        cache.set(key, value, None)
+    grown = _private_memory() - before
+    barrier.wait()
+    if number == 0:
+        cache.set("version:index", number + 1, None)
+    barrier.wait()
+    sees_update = cache.get("version:index") is not None
+    latencies = []
+    for _ in range(options["reads"]):
+        key = rnd.choice(keys)
+        started = time.perf_counter()
+        cache.get(key)
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    results.put((grown, latencies, sees_update))
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает LocMemCache и общий SQLiteCache при нескольких "
+        "процессах: задержку попадания, память и видимость сброса"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--keys", type=int, default=200)
+        parser.add_argument("--value-size", type=int, default=30_000,
+                            help="размер значения в байтах (страница)")
+        parser.add_argument("--reads", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        params = {"OPTIONS": {"MAX_ENTRIES": options["keys"] * 10}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.sqlite3")
+            backends = [
+                ("LocMemCache", lambda: LocMemCache("bench", params)),
+                ("SQLiteCache", lambda: SQLiteCache(path, params)),
+            ]
+            for name, make_cache in backends:
+                self.run(name, make_cache, options)
+                if name == "SQLiteCache":
+                    size = sum(
+                        os.path.getsize(os.path.join(directory, file))
+                        for file in os.listdir(directory)
+                    )
+                    self.stdout.write(
+                        f"  файл кэша (общий): {size / 2 ** 20:.1f} МБ")
+
+    def run(self, name, make_cache, options):
+        context = multiprocessing.get_context("fork")
+        barrier = context.Barrier(options["workers"])
+        results = context.Queue()
+        workers = [
+            context.Process(target=_work, args=(
+                make_cache, number, options, barrier, results))
+            for number in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        collected = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+
+        latencies = [value for _, values, _ in collected for value in values]
+        grown = sum(value for value, _, _ in collected)
+        visible = sum(1 for _, _, sees in collected if sees)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name}: {options['workers']} процессов, {options['keys']} "
+            f"ключей по {options['value_size'] // 1000} КБ"
+        ))
+        self.stdout.write(
+            f"  попадание: p50 {statistics.median(latencies):.1f} мкс, "
+            f"p95 {bench.percentile(latencies, 0.95):.1f} мкс"
+        )
+        self.stdout.write(
+            f"  рост собственной памяти воркеров: {grown / 2 ** 20:.1f} МБ "
+            f"суммарно"
+        )
+        self.stdout.write(
+            f"  сброс версии виден в {visible} из {options['workers']} "
+            f"процессов"
+        )
@@ -0,0 +1,158 @@
+import multiprocessing
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts import bench
+from posts.models import Group, Post, User
+from yatube.sqlite import profile_pragmas
+
+DUMMY_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+}
+
+
+def _work(role, profile, duration, start_at, targets, writer):
+    """
+    Процесс нагрузки: читатель обходит страницы, писатель публикует посты и
+    комментарии. После каждого запроса соединения закрываются так же, как
+    в настоящем сервере по request_finished, с учётом CONN_MAX_AGE профиля.
+    """
+    for database in settings.DATABASES.values():
+        database["CONN_MAX_AGE"] = \
+            settings.SQLITE_PROFILES[profile]["CONN_MAX_AGE"]
+    connections.close_all()
+    rnd = random.Random()
+    latencies, errors = [], 0
+    # Кэш страниц отключён: иначе читатели мерили бы кэш, а не базу
+    with override_settings(DB_PROFILE=profile, CACHES=DUMMY_CACHE):
+        client = Client()
+        if writer:
+            client.force_login(User.objects.get(username=writer))
+        close_old_connections()
+        time.sleep(max(0, start_at - time.time()))
+        deadline = start_at + duration
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                if role == "read":
+                    response = client.get(rnd.choice(targets["pages"]))
+                elif rnd.random() < 0.5:
+                    response = client.post(reverse("new_post"),
+                                           {"text": "Пост под нагрузкой"})
+                else:
+                    username, post_id = rnd.choice(targets["posts"])
+                    response = client.post(
+                        reverse("add_comment", args=[username, post_id]),
+                        {"text": "Комментарий под нагрузкой"},
+                    )
+                if response.status_code >= 500:
+                    errors += 1
+                else:
+                    latencies.append(
+                        (time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+            close_old_connections()
+    connections.close_all()
+    return role, latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Мерит пропускную способность чтения страниц, пока параллельно "
+        "публикуются посты и комментарии, в профилях базы default и "
+        "production"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", action="store_true",
+            help="предварительно наполнить базу синтетическими данными",
+        )
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument(
+            "--profile", choices=["default", "production", "both"],
+            default="both",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Команда работает только с SQLite")
+        if options["seed"]:
+            bench.seed(posts=options["posts"], comments=options["posts"] // 10,
+                       stdout=self.stdout)
+        targets = self.targets()
+        writers = list(User.objects.filter(
+            username__startswith=bench.BENCH_PREFIX).exclude(
+            username=bench.READER).values_list("username", flat=True)[
+            :options["writers"]])
+        if not targets["posts"] or len(writers) < options["writers"]:
+            raise CommandError("База пуста: запустите команду с --seed")
+
+        profiles = (["default", "production"] if options["profile"] == "both"
+                    else [options["profile"]])
+        try:
+            for profile in profiles:
+                self.run(profile, options, targets, writers)
+        finally:
+            self.set_journal_mode(settings.DB_PROFILE)
+
+    def targets(self):
+        posts = list(Post.objects.order_by("-id").values_list(
+            "author__username", "id")[:200])
+        groups = Group.objects.values_list("slug", flat=True)[:20]
+        pages = [reverse("index")] + [
+            f"{reverse('index')}?page={number}" for number in range(2, 20)
+        ]
+        pages += [reverse("group_posts", args=[slug]) for slug in groups]
+        pages += [reverse("profile", args=[username])
+                  for username, _ in posts[:50]]
+        pages += [reverse("post", args=post) for post in posts[:50]]
+        return {"posts": posts, "pages": pages}
+
+    def set_journal_mode(self, profile):
+        mode = profile_pragmas(profile).get("journal_mode", "delete")
+        connections.close_all()
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA journal_mode = {mode}")
+        connections.close_all()
+
+    def run(self, profile, options, targets, writers):
+        self.set_journal_mode(profile)
+        start_at = time.time() + 2
+        jobs = (
+            [("read", profile, options["duration"], start_at, targets, None)]
+            * options["readers"]
+            + [("write", profile, options["duration"], start_at, targets,
+                writer) for writer in writers]
+        )
+        context = multiprocessing.get_context("fork")
+        with context.Pool(len(jobs)) as pool:
+            results = pool.starmap(_work, jobs)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Профиль {profile}: {options['readers']} читателей, "
+            f"{len(writers)} писателей, {options['duration']:.0f} с"
+        ))
+        for role, label in (("read", "чтение"), ("write", "запись")):
+            latencies = [value for kind, values, _ in results
+                         if kind == role for value in values]
+            errors = sum(count for kind, _, count in results if kind == role)
+            median = statistics.median(latencies) if latencies else 0.0
+            p95 = bench.percentile(latencies, 0.95) or 0.0
+            self.stdout.write(
+                f"  {label}: {len(latencies) / options['duration']:.1f} "
+                f"запросов/с, p50 {median:.1f} мс, "
+                f"p95 {p95:.1f} мс, "
+                f"ошибок {errors}"
+            )
@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from posts import bench
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Показывает план (EXPLAIN) и время запросов каждой страницы из "
+        "posts/urls.py без составных индексов и с ними"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", action="store_true",
+            help="предварительно наполнить базу синтетическими данными",
+        )
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            bench.seed(users=options["users"], posts=options["posts"],
+                       comments=options["comments"], stdout=self.stdout)
+        reader = User.objects.filter(username=bench.READER).first()
+        post = Post.objects.order_by("-id").first()
+        group = Group.objects.first()
+        if reader is None or post is None or group is None:
+            raise CommandError("База пуста: запустите команду с --seed")
+
+        queries = self.queries(reader, post, group)
+        indexes = [index for model in (Post, Comment)
+                   for index in model._meta.indexes]
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index in indexes:
+                    cursor.execute(
+                        "DROP INDEX %s" % connection.ops.quote_name(index.name)
+                    )
+            before = self.run(queries, options["repeat"])
+            transaction.set_rollback(True)
+        after = self.run(queries, options["repeat"])
+
+        for name, _ in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, results in (("без индексов", before),
+                                   ("с индексами", after)):
+                plan, median, best = results[name]
+                self.stdout.write(
+                    f"  {label}: медиана {median:.2f} мс, минимум {best:.2f} мс"
+                )
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+
+    def run(self, queries, repeat):
+        results = {}
+        for name, queryset in queries:
+            plan = queryset.explain()
+            median, best = bench.measure(lambda: list(queryset.all()), repeat)
+            results[name] = (plan, median, best)
+        return results
+
+    def queries(self, reader, post, group):
+        """Запросы, которые выполняют представления posts/views.py."""
+        feed = Post.objects.for_feed().order_by("-pub_date", "-id")
+        author = post.author
+        return [
+            ("index", feed[:10]),
+            ("index ?page=500", feed[4990:5000]),
+            ("group_posts", feed.filter(group=group)[:10]),
+            ("profile", feed.filter(author=author)[:10]),
+            ("post", Post.objects.for_feed().filter(
+                id=post.id, author__username=author.username)),
+            ("post: comments", Comment.objects.filter(
+                post=post).order_by("created", "id")),
+            ("post_edit", Post.objects.filter(
+                id=post.id, author__username=author.username)),
+            ("follow_index", Post.objects.for_feed().filter(
+                feed_entries__user=reader).order_by(
+                "-feed_entries__pub_date", "-id")[:10]),
+            ("new_post: fan-out", Follow.objects.filter(
+                author=author).values_list("user_id", flat=True)),
+            ("profile_follow", Follow.objects.filter(
+                user=reader, author=author)),
+            ("profile_unfollow", Post.objects.filter(
+                feed_entries__user=reader, author=author)),
+        ]
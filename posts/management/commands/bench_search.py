@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import bench, search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает поиск по индексу SearchTerm с поиском icontains, "
+        "как в админке"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", action="store_true",
+            help="предварительно наполнить базу синтетическими данными",
+        )
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--comments", type=int, default=100_000)
+        parser.add_argument(
+            "--rebuild", action="store_true",
+            help="пересобрать индекс и замерить время сборки",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            bench.seed(users=options["users"], posts=options["posts"],
+                       comments=options["comments"], stdout=self.stdout)
+        if options["seed"] or options["rebuild"]:
+            started = time.perf_counter()
+            count = search.rebuild()
+            self.stdout.write(
+                f"Индекс по {count} постам собран за "
+                f"{time.perf_counter() - started:.1f} с"
+            )
+        post = Post.objects.order_by("-id").first()
+        if post is None:
+            raise CommandError("База пуста: запустите команду с --seed")
+
+        queries = [
+            bench.WORDS[0],
+            bench.WORDS[len(bench.WORDS) // 2],
+            bench.WORDS[-1],
+            f"{bench.WORDS[1]} {bench.WORDS[-2]}",
+            " ".join(bench.WORDS[3:6]),
+        ]
+        repeat = options["repeat"]
+        for query in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f"«{query}»"))
+            found = len(search.find(query))
+            median, best = bench.measure(lambda: search.find(query), repeat)
+            self.stdout.write(
+                f"  индекс: медиана {median:.2f} мс, минимум {best:.2f} мс, "
+                f"найдено {found}"
+            )
+            icontains = Post.objects.all()
+            for word in query.split():
+                icontains = icontains.filter(text__icontains=word)
+            icontains = icontains.order_by("-pub_date", "-id").values_list(
+                "id", flat=True)[:settings.SEARCH_MAX_RESULTS]
+            median, best = bench.measure(lambda: list(icontains.all()),
+                                         repeat)
+            self.stdout.write(
+                f"  icontains: медиана {median:.2f} мс, минимум {best:.2f} мс"
+            )
+
+        median, best = bench.measure(lambda: search.index_post(post.pk),
+                                     repeat)
+        self.stdout.write(
+            f"Переиндексация одного поста: медиана {median:.2f} мс, "
+            f"минимум {best:.2f} мс"
+        )
@@ -0,0 +1,339 @@
+import http.client
+import json
+import multiprocessing
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (ThreadedWSGIServer,
+                                          WSGIRequestHandler)
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts import bench
+from posts.models import Comment, Group, Post, User
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+SERVER_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _serve(server):
+    """
+    Процесс сервера: как в продакшене, без DEBUG и журнала запросов, но
+    с Server-Timing для всех, чтобы считать SQL-запросы.
+    """
+    settings.DEBUG = False
+    settings.METRICS_SERVER_TIMING = True
+    server.serve_forever()
+
+
+class VirtualUser:
+    """Клиент со своими cookie (сессия, csrftoken) поверх http.client."""
+
+    def __init__(self, address, user=None, session=None):
+        self.address = address
+        self.user = user
+        self.cookies = SimpleCookie()
+        if session:
+            self.cookies[settings.SESSION_COOKIE_NAME] = session
+        self.csrf = None
+        self.own_post = None
+
+    def request(self, method, path, data=None):
+        """Возвращает (статус, тело, число SQL-запросов из Server-Timing)."""
+        headers = {"Cookie": "; ".join(
+            f"{name}={morsel.value}" for name, morsel in self.cookies.items())}
+        body = None
+        if data is not None:
+            data = {**data, "csrfmiddlewaretoken": self.csrf}
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        connection = http.client.HTTPConnection(*self.address, timeout=60)
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+        finally:
+            connection.close()
+        for header in response.headers.get_all("Set-Cookie") or []:
+            self.cookies.load(header)
+        queries = SERVER_QUERIES.search(
+            response.headers.get("Server-Timing", ""))
+        return (response.status, content,
+                int(queries.group(1)) if queries else None)
+
+    def fetch_csrf(self):
+        """Берёт токен из формы, как браузер перед отправкой."""
+        _, content, _ = self.request("GET", reverse("new_post"))
+        match = CSRF_INPUT.search(content.decode())
+        if match is None:
+            raise CommandError("Не найден csrf-токен в форме нового поста")
+        self.csrf = match.group(1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест всех именованных адресов posts/urls.py и API на "
+        "локальном WSGI-сервере: p50/p95/p99, пропускная способность и "
+        "число SQL-запросов в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", action="store_true",
+            help="предварительно наполнить базу синтетическими данными",
+        )
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--posts-per-author", type=float, default=100)
+        parser.add_argument("--follows-per-user", type=int, default=50)
+        parser.add_argument("--comments-per-post", type=float, default=0.2)
+        parser.add_argument("--images", type=int, default=0,
+                            help="сколько постов получат картинку")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=200,
+                            help="запросов на каждый адрес")
+        parser.add_argument("--routes", default="",
+                            help="имена адресов через запятую (по умолчанию "
+                                 "все)")
+        parser.add_argument("--random-seed", type=int, default=1)
+        parser.add_argument("--output", help="файл для JSON-отчёта")
+        parser.add_argument("--compare",
+                            help="JSON-отчёт прошлого запуска для сравнения")
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            posts = int(options["users"] * options["posts_per_author"])
+            bench.seed(users=options["users"], posts=posts,
+                       comments=int(posts * options["comments_per_post"]),
+                       follows=options["follows_per_user"],
+                       images=options["images"], stdout=self.stdout)
+        rnd = random.Random(options["random_seed"])
+        targets = self.targets()
+        users = list(User.objects.filter(
+            username__startswith=bench.BENCH_PREFIX).exclude(
+            username=bench.READER)[:options["concurrency"]])
+        if not targets["posts"] or len(users) < options["concurrency"]:
+            raise CommandError("База пуста: запустите команду с --seed")
+        routes = self.routes(targets)
+        if options["routes"]:
+            names = options["routes"].split(",")
+            unknown = set(names) - {name for name, *_ in routes}
+            if unknown:
+                raise CommandError(f"Неизвестные адреса: {sorted(unknown)}")
+            routes = [route for route in routes if route[0] in names]
+
+        sessions = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            sessions.append(
+                client.cookies[settings.SESSION_COOKIE_NAME].value)
+        connections.close_all()
+
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler)
+        server.set_app(WSGIHandler())
+        process = multiprocessing.get_context("fork").Process(
+            target=_serve, args=(server,), daemon=True)
+        process.start()
+        address = server.server_address
+        server.socket.close()
+        try:
+            report = self.run(address, routes, users, sessions, rnd, options)
+        finally:
+            process.terminate()
+            process.join()
+
+        report["dataset"] = {
+            "users": User.objects.count(), "posts": Post.objects.count(),
+            "comments": Comment.objects.count(),
+            "images": Post.objects.exclude(image="").exclude(
+                image=None).count(),
+        }
+        report["commit"] = self.commit()
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as target:
+                target.write(text + "\n")
+        else:
+            self.stdout.write(text)
+        if options["compare"]:
+            self.compare(options["compare"], report)
+
+    def targets(self):
+        posts = list(Post.objects.order_by("-id").values_list(
+            "author__username", "id")[:500])
+        commented = list(Comment.objects.order_by("-id").values_list(
+            "post__author__username", "post_id")[:200]) or posts
+        return {
+            "posts": posts,
+            "commented": commented,
+            "groups": list(Group.objects.values_list("slug", flat=True)[:50]),
+            "authors": sorted({username for username, _ in posts}),
+            "words": bench.WORDS,
+        }
+
+    def routes(self, targets):
+        """
+        (имя, метод, нужен ли вход, функция адреса и данных формы). Функция
+        получает виртуального пользователя и генератор случайных чисел.
+        """
+        def post(rnd):
+            return list(rnd.choice(targets["posts"]))
+
+        def author(rnd):
+            return rnd.choice(targets["authors"])
+
+        def get(name, args=lambda user, rnd: [], query=None):
+            return lambda user, rnd: (
+                reverse(name, args=args(user, rnd))
+                + (f"?{urlencode(query(rnd))}" if query else ""), None)
+
+        def own(user, rnd):
+            return [user.user.username, user.own_post]
+
+        return [
+            ("index", "GET", False,
+             get("index", query=lambda rnd: {"page": rnd.randint(1, 20)})),
+            ("group_posts", "GET", False, get(
+                "group_posts", lambda user, rnd: [
+                    rnd.choice(targets["groups"])])),
+            ("profile", "GET", False,
+             get("profile", lambda user, rnd: [author(rnd)])),
+            ("post", "GET", False, get("post", lambda user, rnd: post(rnd))),
+            ("post_comments", "GET", False, get(
+                "post_comments",
+                lambda user, rnd: list(rnd.choice(targets["commented"])))),
+            ("search", "GET", False, get(
+                "search", query=lambda rnd: {
+                    "q": rnd.choice(targets["words"])})),
+            ("trending", "GET", False, get("trending")),
+            ("follow_index", "GET", True, get("follow_index")),
+            ("new_post", "GET", True, get("new_post")),
+            ("new_post", "POST", True, lambda user, rnd: (
+                reverse("new_post"), {"text": "Пост под нагрузкой"})),
+            ("add_comment", "POST", True, lambda user, rnd: (
+                reverse("add_comment", args=post(rnd)),
+                {"text": "Комментарий под нагрузкой"})),
+            ("post_edit", "GET", True, get("post_edit", own)),
+            ("post_edit", "POST", True, lambda user, rnd: (
+                reverse("post_edit", args=own(user, rnd)),
+                {"text": f"Правка {rnd.random()}"})),
+            ("profile_follow", "GET", True, get(
+                "profile_follow", lambda user, rnd: [author(rnd)])),
+            ("profile_unfollow", "GET", True, get(
+                "profile_unfollow", lambda user, rnd: [author(rnd)])),
+            ("api_index", "GET", False, get("api_index")),
+            ("api_group_posts", "GET", False, get(
+                "api_group_posts", lambda user, rnd: [
+                    rnd.choice(targets["groups"])])),
+            ("api_profile", "GET", False,
+             get("api_profile", lambda user, rnd: [author(rnd)])),
+            ("api_post", "GET", False,
+             get("api_post", lambda user, rnd: post(rnd)[1:])),
+            ("api_follow_index", "GET", True, get("api_follow_index")),
+        ]
+
+    def run(self, address, routes, users, sessions, rnd, options):
+        guests = [VirtualUser(address) for _ in users]
+        members = [VirtualUser(address, user, session)
+                   for user, session in zip(users, sessions)]
+        for member in members:
+            member.fetch_csrf()
+            member.own_post = Post.objects.create(
+                text="Пост для правки под нагрузкой", author=member.user).id
+        connections.close_all()
+
+        results = {}
+        for name, method, login, make in routes:
+            clients = members if login else guests
+            seeds = [rnd.random() for _ in clients]
+            per_client = max(1, options["requests"] // len(clients))
+            samples = [[] for _ in clients]
+
+            def work(number):
+                client, local = clients[number], random.Random(seeds[number])
+                for _ in range(per_client):
+                    path, data = make(client, local)
+                    started = time.perf_counter()
+                    try:
+                        status, _, queries = client.request(method, path,
+                                                            data)
+                    except OSError:
+                        status, queries = 599, None
+                    samples[number].append(
+                        (time.perf_counter() - started, status, queries))
+
+            threads = [threading.Thread(target=work, args=(number,))
+                       for number in range(len(clients))]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            rows = [row for part in samples for row in part]
+            ok = [round(seconds * 1000, 2) for seconds, status, _ in rows
+                  if status < 400]
+            queries = [count for _, status, count in rows
+                       if status < 400 and count is not None]
+            key = name if method == "GET" else f"{name} {method}"
+            results[key] = {
+                "requests": len(rows),
+                "errors": len(rows) - len(ok),
+                "rps": round(len(rows) / elapsed, 1),
+                "p50_ms": bench.percentile(ok, 0.5),
+                "p95_ms": bench.percentile(ok, 0.95),
+                "p99_ms": bench.percentile(ok, 0.99),
+                "queries_p50": statistics.median(queries) if queries
+                else None,
+                "queries_max": max(queries) if queries else None,
+            }
+            self.stderr.write(
+                f"{key}: {results[key]['rps']} запросов/с, "
+                f"p95 {results[key]['p95_ms']} мс, "
+                f"ошибок {results[key]['errors']}")
+        return {
+            "concurrency": options["concurrency"],
+            "requests_per_route": options["requests"],
+            "db_profile": settings.DB_PROFILE,
+            "cache": settings.CACHES["default"]["BACKEND"],
+            "routes": results,
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, report):
+        with open(path) as source:
+            previous = json.load(source)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"p95 относительно {previous.get('commit') or path}"))
+        for name, current in report["routes"].items():
+            before = previous["routes"].get(name)
+            if not before or not before["p95_ms"] or not current["p95_ms"]:
+                continue
+            change = (current["p95_ms"] / before["p95_ms"] - 1) * 100
+            line = (f"  {name}: {before['p95_ms']} → {current['p95_ms']} мс "
+                    f"({change:+.0f}%)")
+            self.stdout.write(self.style.ERROR(line) if change > 20
+                              else line)
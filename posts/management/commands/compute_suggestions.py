@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рекомендации «на кого подписаться» (друзья друзей); "
+        "запускайте периодически, например из cron"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--limit", type=int,
+                            help="рекомендаций на пользователя (по умолчанию "
+                                 "SUGGESTIONS_PER_USER)")
+
+    def handle(self, *args, **options):
+        total = suggestions.compute(
+            batch_size=options["batch_size"], limit=options["limit"],
+            stdout=self.stdout if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Сохранено рекомендаций: {total}")
+        )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет рейтинг популярного событиями с прошлого запуска; "
+        "запускайте периодически, например раз в пять минут из cron"
+    )
+
+    def handle(self, *args, **options):
+        events = trending.compute()
+        self.stdout.write(self.style.SUCCESS(f"Учтено событий: {events}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Выгружает пользователей, группы, посты, комментарии и подписки в "
+        "NDJSON (по объекту в строке)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", nargs="?", default="-",
+                            help="файл NDJSON или - для stdout")
+        parser.add_argument("--chunk-size", type=int,
+                            default=transfer.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["output"] == "-":
+            transfer.dump(self.stdout, options["chunk_size"])
+            return
+        with open(options["output"], "w", encoding="utf-8") as output:
+            count = transfer.dump(output, options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Выгружено объектов: {count}"))
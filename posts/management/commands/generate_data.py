@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from posts import generate
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует миллионы постов, комментариев и подписок с перекосом "
+        "как в живой сети (знаменитости, горячие группы); результат "
+        "определяется --seed и не зависит от числа процессов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--posts", type=int, default=1_000_000)
+        parser.add_argument("--comments", type=int, default=3_000_000)
+        parser.add_argument("--follows", type=float, default=50,
+                            help="среднее число подписок пользователя")
+        parser.add_argument("--max-follows", type=int, default=5000)
+        parser.add_argument("--groups", type=int, default=200)
+        parser.add_argument("--group-share", type=float, default=0.6,
+                            help="доля постов в группах")
+        parser.add_argument("--follow-skew", type=float, default=1.1,
+                            help="показатель Ципфа для числа подписчиков")
+        parser.add_argument("--author-skew", type=float, default=0.9,
+                            help="показатель Ципфа для числа постов автора")
+        parser.add_argument("--group-skew", type=float, default=1.3,
+                            help="показатель Ципфа для популярности групп")
+        parser.add_argument("--days", type=int, default=365)
+        parser.add_argument("--prefix", default="gen",
+                            help="префикс имён пользователей и slug групп")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--workers", type=int,
+                            help="число процессов (по умолчанию — по ядрам)")
+        parser.add_argument(
+            "--no-rebuild", action="store_false", dest="rebuild",
+            help="не пересобирать ленты, счётчики, поиск и кэш",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            totals = generate.generate(
+                users=options["users"], posts=options["posts"],
+                comments=options["comments"], follows=options["follows"],
+                max_follows=options["max_follows"], groups=options["groups"],
+                group_share=options["group_share"],
+                follow_skew=options["follow_skew"],
+                author_skew=options["author_skew"],
+                group_skew=options["group_skew"], days=options["days"],
+                prefix=options["prefix"], seed=options["seed"],
+                workers=options["workers"], rebuild=options["rebuild"],
+                stdout=self.stdout if options["verbosity"] > 1 else None,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано строк: {rows} за {elapsed:.0f} с "
+            f"({rows / elapsed:.0f} строк/с)"))
+        for model, count in totals.items():
+            self.stdout.write(f"  {model}: {count}")
+        top = User.objects.filter(
+            username__startswith=options["prefix"]).annotate(
+            followers=Count("following")).order_by("-followers")[:5]
+        self.stdout.write("Больше всего подписчиков: " + ", ".join(
+            f"{user.username} ({user.followers})" for user in top))
+        posts = Post.objects.filter(
+            author__username__startswith=options["prefix"])
+        if totals["posts"]:
+            grouped = posts.exclude(group=None).count()
+            self.stdout.write(
+                f"Постов в группах: {grouped / totals['posts']:.0%}")
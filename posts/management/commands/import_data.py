@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from posts import transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает NDJSON из export_data пачками через bulk_create; "
+        "прерванная загрузка продолжается с контрольной точки"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="файл NDJSON")
+        parser.add_argument(
+            "--checkpoint",
+            help="файл контрольной точки (по умолчанию <input>.checkpoint)",
+        )
+        parser.add_argument("--chunk-size", type=int,
+                            default=transfer.CHUNK_SIZE)
+        parser.add_argument(
+            "--no-rebuild", action="store_false", dest="rebuild",
+            help="не пересобирать ленты, счётчики, поиск и кэш",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options["checkpoint"] or f"{options['input']}.checkpoint"
+        with open(options["input"], encoding="utf-8") as source:
+            count = transfer.load(
+                source, checkpoint, chunk_size=options["chunk_size"],
+                rebuild=options["rebuild"],
+                stdout=self.stdout if options["verbosity"] > 1 else None,
+            )
+        self.stdout.write(self.style.SUCCESS(f"Загружено объектов: {count}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = "Пересобирает ленты подписок (FeedEntry) с нуля"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user", type=int, action="append", dest="user_ids",
+            help="id пользователя, чью ленту нужно пересобрать",
+        )
+
+    def handle(self, *args, **options):
+        count = feed.rebuild(options["user_ids"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Ленты пересобраны, подписок: {count}")
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Пересобирает поисковый индекс (SearchTerm) по постам и комментариям"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int,
+                            default=search.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = search.rebuild(options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Индекс пересобран, постов: {count}")
+        )
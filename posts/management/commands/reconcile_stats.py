@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счётчики профилей (UserStats) и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = stats.reconcile(batch_size=options["batch_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Исправлено профилей: {fixed}")
+        )
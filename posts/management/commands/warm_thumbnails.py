@@ -0,0 +1,47 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+# Задач в работе на поток: строки читаются из базы по мере выполнения,
+# а не все сразу
+WINDOW = 4
+
+
+def _results(pool, rows, window):
+    """Результаты process по порядку, не больше window задач в работе."""
+    pending = deque()
+    for row in rows:
+        pending.append(pool.submit(thumbnails.process_in_thread, *row))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class Command(BaseCommand):
+    help = (
+        "Заранее строит миниатюры и адаптивные варианты для всех картинок "
+        "постов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image="").exclude(image=None).\
+            values_list("pk", "image")
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for ok in _results(pool, posts.iterator(),
+                               WINDOW * options["workers"]):
+                if ok:
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Картинок обработано: {done}, ошибок: {failed}"
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_index(apps, schema_editor):
+    from posts import search
+    search.rebuild(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.IntegerField(default=0)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='posts.Post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'weight', 'post'], name='posts_searc_term_c7f9bc_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together={('term', 'post')},
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
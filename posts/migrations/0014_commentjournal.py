@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentJournal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255, unique=True)),
+                ('offset', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 
@@ -6,10 +7,26 @@ User = get_user_model()
 
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты с авторами, группами и числом комментариев одним запросом."""
+        comments = Comment.objects.filter(post=models.OuterRef("pk")).\
+            order_by().values("post").annotate(total=models.Count("pk")).\
+            values("total")
+        return self.select_related("author", "group").annotate(
+            comment_count=Coalesce(
+                models.Subquery(comments, output_field=models.IntegerField()),
+                0,
+            )
+        )
+
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name="Заголовок")
     slug = models.SlugField(unique=True, verbose_name="Подзаголовок")
     description = models.TextField(verbose_name="Описание")
+    updated = models.DateTimeField("date updated", auto_now=True)
 
 
     class Meta:
@@ -25,6 +42,7 @@ class Group(models.Model):
 class Post(models.Model):
     text = models.TextField(verbose_name="Текст")
     pub_date = models.DateTimeField("date published", auto_now_add=True)
+    updated = models.DateTimeField("date updated", auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name="posts", verbose_name="Автор")
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
@@ -35,12 +53,23 @@ class Post(models.Model):
                               null=True,
                               verbose_name="Картинка"
                               )
+    image_variants = models.TextField(blank=True, default="",
+                                      verbose_name="Размеры картинки")
+
+    objects = PostQuerySet.as_manager()
 
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = "Пост"
         verbose_name_plural = "Посты"
+        # Возрастающие индексы читаются в обратном порядке и покрывают
+        # сортировку лент (-pub_date, -id) без дополнительной сортировки.
+        indexes = [
+            models.Index(fields=["pub_date"]),
+            models.Index(fields=["author", "pub_date"]),
+            models.Index(fields=["group", "pub_date"]),
+        ]
 
     def __str__(self):
         return self.text[:10]
@@ -55,6 +84,9 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField("date published", auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["post", "created"])]
+
 
 
 class Follow(models.Model):
@@ -66,3 +98,90 @@ class Follow(models.Model):
     )
     class Meta:
         unique_together = ["user", "author"]
+
+
+
+class FeedEntry(models.Model):
+    """Запись персональной ленты: пост автора, на которого подписан user."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feed"
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="feed_entries"
+    )
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        ordering = ["-pub_date"]
+        unique_together = ["user", "post"]
+        indexes = [models.Index(fields=["user", "-pub_date"])]
+
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики профиля, обновляются сигналами."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name="stats")
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+
+
+
+class SearchTerm(models.Model):
+    """Запись поискового индекса: основа слова, пост и её вес в посте."""
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="search_terms"
+    )
+    weight = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ["term", "post"]
+        # Для запроса из одного слова лучшие посты читаются прямо из
+        # индекса по убыванию веса, без группировки и сортировки
+        indexes = [models.Index(fields=["term", "weight", "post"])]
+
+
+class FollowSuggestion(models.Model):
+    """
+    Кого подписать: автор, на которого подписаны те, на кого подписан
+    user. Таблицу периодически пересчитывает compute_suggestions.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="suggestions"
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="suggested_to"
+    )
+    # Число общих подписок; у популярных авторов без общих подписок 0
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ["user", "author"]
+        indexes = [models.Index(fields=["user", "-score"])]
+
+
+class TrendingScore(models.Model):
+    """Затухающий вес недавней активности поста или группы."""
+    kind = models.CharField(max_length=8)
+    object_id = models.PositiveIntegerField()
+    score = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ["kind", "object_id"]
+        indexes = [models.Index(fields=["kind", "-score"])]
+
+
+class TrendingRun(models.Model):
+    """Последние комментарий и пост, уже учтённые в TrendingScore."""
+    computed = models.DateTimeField()
+    last_comment_id = models.PositiveIntegerField(default=0)
+    last_post_id = models.PositiveIntegerField(default=0)
+
+
+class CommentJournal(models.Model):
+    """Позиция в журнале отложенных комментариев, до которой они в базе."""
+    path = models.CharField(max_length=255, unique=True)
+    offset = models.BigIntegerField(default=0)
@@ -0,0 +1,189 @@
+"""
+Курсорная (keyset) пагинация.
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по ключу сортировки
+последней показанной записи, например (pub_date, id), поэтому стоимость
+запроса не зависит от номера страницы.
+"""
+import base64
+import binascii
+import datetime
+import json
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+
+def encode_cursor(values):
+    values = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    data = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def decode_cursor(cursor):
+    """Возвращает значения ключа из курсора или None для битого курсора."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data.decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(values, list) or not all(
+            isinstance(value, (str, int, float))
+            and not isinstance(value, bool) for value in values):
+        return None
+    return [
+        (parse_datetime(value) or value) if isinstance(value, str) else value
+        for value in values
+    ]
+
+
+class CursorPage:
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return "<CursorPage of %s items>" % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self.paginator.cursor_for(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self.paginator.cursor_for(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """
+    Пагинатор по ключу сортировки.
+
+    ordering — поля сортировки (последнее должно быть уникальным, обычно id),
+    значения ключа берутся из одноимённых атрибутов объектов. count считается
+    только при обращении к нему.
+    """
+
+    def __init__(self, object_list, per_page, ordering=("-pub_date", "-id")):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    @cached_property
+    def count(self):
+        return self.object_list.count()
+
+    @property
+    def fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def cursor_for(self, obj):
+        return encode_cursor([getattr(obj, name) for name in self.fields])
+
+    def _output_field(self, name):
+        query = getattr(self.object_list, "query", None)
+        if query is not None and name in query.annotations:
+            return query.annotations[name].output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def clean_cursor(self, cursor):
+        """
+        Значения ключа из курсора, приведённые к типам полей сортировки,
+        или None, если курсор битый или подделан.
+        """
+        values = decode_cursor(cursor)
+        if values is None or len(values) != len(self.ordering):
+            return None
+        cleaned = []
+        for name, value in zip(self.fields, values):
+            try:
+                value = self._output_field(name).to_python(value)
+            except (FieldDoesNotExist, ValidationError, TypeError,
+                    ValueError):
+                return None
+            if value is None:
+                return None
+            cleaned.append(value)
+        return cleaned
+
+    def _seek(self, values, forward):
+        """Условие «строго после ключа» в порядке сортировки (или до него)."""
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") == forward
+            lookup = "%s__%s" % (name, "lt" if descending else "gt")
+            equal = {self.fields[j]: values[j] for j in range(i)}
+            conditions.append(Q(**equal, **{lookup: values[i]}))
+        return reduce(lambda a, b: a | b, conditions)
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith("-") else "-" + field
+            for field in self.ordering
+        ]
+
+    def get_page(self, after=None, before=None, strict=False):
+        """
+        Страница после курсора after или перед before. Битый курсор
+        считается отсутствующим, а при strict — ошибкой InvalidCursor.
+        """
+        after_values = self.clean_cursor(after) if after else None
+        before_values = self.clean_cursor(before) if before else None
+        if strict and (after and after_values is None
+                       or before and before_values is None):
+            raise InvalidCursor("Неверный курсор")
+
+        queryset = self.object_list
+        if before_values:
+            rows = list(
+                queryset.filter(self._seek(before_values, forward=False))
+                .order_by(*self._reversed_ordering())[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, has_next=True,
+                              has_previous=has_previous)
+
+        queryset = queryset.order_by(*self.ordering)
+        if after_values:
+            queryset = queryset.filter(self._seek(after_values, forward=True))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next=has_next,
+                          has_previous=after_values is not None)
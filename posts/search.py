@@ -0,0 +1,178 @@
+"""
+Полнотекстовый поиск по постам и комментариям.
+
+Индекс хранится в таблице SearchTerm: основа слова (posts/stemmer.py),
+пост и вес — число вхождений, причём слово из текста поста весит
+POST_TEXT_WEIGHT, а из комментария — 1. Индекс обновляют сигналы: правка
+текста поста переиндексирует пост, новый или удалённый комментарий
+прибавляет или вычитает свои слова. Массовые вставки сигналы обходят,
+после них нужна команда rebuild_search_index.
+
+В выдачу попадают посты со всеми основами запроса, порядок — по сумме
+весов, умноженных на idf основы.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              Sum, Value, When)
+
+from .bulk import batched
+from .models import Comment, Post, SearchTerm
+from .stemmer import stem
+
+POST_TEXT_WEIGHT = 3
+BATCH_SIZE = 1000
+MAX_TERM_LENGTH = 64
+POST_COUNT_TIMEOUT = 60 * 5
+
+WORD_RE = re.compile(r"\w+")
+STOP_WORDS = frozenset("""
+    а без более бы был была были было быть в вам вас весь во вот все всего
+    всех вы где да даже для до его ее если есть еще же за здесь и из или им
+    их к как ко когда кто ли либо мне может мы на над надо наш не него нее
+    нет ни них но ну о об однако он она они оно от очень по под при с со
+    так также такой там те тем то того тоже той только том ты у уже хотя
+    чего чей чем что чтобы чье чья эта эти это я
+""".split())
+
+
+def terms(text):
+    """Основы слов текста с числом вхождений, без стоп-слов."""
+    words = (word.lower().replace("ё", "е") for word in WORD_RE.findall(text))
+    return Counter(
+        stem(word)[:MAX_TERM_LENGTH] for word in words
+        if len(word) > 1 and word not in STOP_WORDS
+    )
+
+
+def document_terms(text, comments=()):
+    """Веса основ поста вместе с его комментариями."""
+    counts = Counter()
+    for term, count in terms(text).items():
+        counts[term] = count * POST_TEXT_WEIGHT
+    for comment in comments:
+        counts.update(terms(comment))
+    return counts
+
+
+def index_post(post_id):
+    """Переиндексирует пост целиком."""
+    text = Post.objects.filter(pk=post_id).values_list("text", flat=True).\
+        first()
+    if text is None:
+        return
+    comments = Comment.objects.filter(post_id=post_id).\
+        values_list("text", flat=True)
+    counts = document_terms(text, comments.iterator())
+    with transaction.atomic():
+        SearchTerm.objects.filter(post_id=post_id).delete()
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post_id, weight=weight)
+            for term, weight in counts.items()
+        )
+
+
+def _adjust(post_id, counts, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) веса основ поста."""
+    if not counts:
+        return
+    rows = SearchTerm.objects.filter(post_id=post_id)
+    existing = set(rows.filter(term__in=counts).
+                   values_list("term", flat=True))
+    by_delta = defaultdict(list)
+    for term in existing:
+        by_delta[counts[term]].append(term)
+    with transaction.atomic():
+        for delta, group in by_delta.items():
+            rows.filter(term__in=group).update(
+                weight=F("weight") + sign * delta)
+        if sign > 0:
+            SearchTerm.objects.bulk_create(
+                [SearchTerm(term=term, post_id=post_id, weight=count)
+                 for term, count in counts.items() if term not in existing],
+                ignore_conflicts=True,
+            )
+        else:
+            rows.filter(weight__lte=0).delete()
+
+
+def add_comment(post_id, text):
+    _adjust(post_id, terms(text), 1)
+
+
+def remove_comment(post_id, text):
+    _adjust(post_id, terms(text), -1)
+
+
+def rebuild(batch_size=BATCH_SIZE, apps=None):
+    """
+    Строит индекс заново пачками постов; возвращает число постов.
+    apps передаёт миграция, чтобы работать с историческими моделями.
+    """
+    post_model, comment_model, term_model = (
+        (Post, Comment, SearchTerm) if apps is None else
+        (apps.get_model("posts", name)
+         for name in ("Post", "Comment", "SearchTerm"))
+    )
+    term_model.objects.all().delete()
+    posts = post_model.objects.order_by("pk").values_list("pk", "text")
+    total = 0
+    for chunk in batched(posts.iterator(), batch_size):
+        comments = defaultdict(list)
+        for post_id, text in comment_model.objects.filter(
+                post_id__in=[post_id for post_id, _ in chunk]).\
+                values_list("post_id", "text"):
+            comments[post_id].append(text)
+        with transaction.atomic():
+            term_model.objects.bulk_create(
+                term_model(term=term, post_id=post_id, weight=weight)
+                for post_id, text in chunk
+                for term, weight in document_terms(
+                    text, comments[post_id]).items()
+            )
+        total += len(chunk)
+    return total
+
+
+def _post_count():
+    return cache.get_or_set("search:post_count", Post.objects.count,
+                            POST_COUNT_TIMEOUT)
+
+
+def find(query, limit=None):
+    """id постов, подходящих под запрос, от самых релевантных."""
+    stems = list(dict.fromkeys(terms(query)))
+    if not stems:
+        return []
+    postings = SearchTerm.objects.filter(term__in=stems)
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    if len(stems) == 1:
+        # Для одной основы порядок по весу совпадает с порядком по рангу
+        return list(postings.order_by("-weight", "-post").
+                    values_list("post", flat=True)[:limit])
+    frequencies = dict(postings.values("term").annotate(
+        total=Count("post")).values_list("term", "total"))
+    if len(frequencies) < len(stems):
+        return []
+    # Кандидаты — посты с самой редкой основой, остальные основы
+    # проверяются точечно по индексу (term, post)
+    rarest = min(stems, key=frequencies.get)
+    postings = postings.filter(post__in=SearchTerm.objects.filter(
+        term=rarest).values("post"))
+    total = max(_post_count(), 1)
+    score = Sum(Case(
+        *[When(term=term, then=ExpressionWrapper(
+            F("weight") * Value(math.log(1 + total / frequencies[term])),
+            output_field=FloatField()))
+          for term in stems],
+        output_field=FloatField(),
+    ))
+    ranked = postings.values("post").annotate(
+        matched=Count("pk"), score=score,
+    ).filter(matched=len(stems)).order_by("-score", "-post")
+    return list(ranked.values_list("post", flat=True)[:limit])
@@ -0,0 +1,139 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import feed, search, stats
+from .cache import bump_on_commit, post_id_scopes, post_scopes
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _post_scopes(post):
+    return post_scopes(post.pk, post.author.username,
+                       post.group.slug if post.group_id else None)
+
+
+# Поля пользователя, которые видны на страницах
+USER_FIELDS = ("username", "first_name", "last_name")
+
+
+def _loaded(instance, fields):
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._loaded_fields = _loaded(instance, USER_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+    old_username = instance._loaded_fields[0]
+    changed = _loaded(instance, USER_FIELDS) != instance._loaded_fields
+    instance._loaded_fields = _loaded(instance, USER_FIELDS)
+    # Сохранение при каждом входе (last_login) страниц не меняет
+    if created or not changed:
+        return
+    scopes = [f"profile:{instance.username}"]
+    if old_username and old_username != instance.username:
+        # Имя автора есть в карточках всех лент
+        scopes += [f"profile:{old_username}", "index", "trending"]
+    bump_on_commit(*scopes)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_on_commit(f"profile:{instance.username}")
+
+
+@receiver(post_init, sender=Group)
+def group_loaded(sender, instance, **kwargs):
+    instance._loaded_slug = instance.__dict__.get("slug")
+
+
+def _group_scopes(instance):
+    # Название группы есть в карточках её постов на index и в популярном
+    scopes = [f"group:{instance.slug}", "index", "trending"]
+    if instance._loaded_slug and instance._loaded_slug != instance.slug:
+        scopes.append(f"group:{instance._loaded_slug}")
+    return scopes
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        bump_on_commit(*_group_scopes(instance))
+    instance._loaded_slug = instance.slug
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # Посты остаются без группы (SET_NULL одним UPDATE, без сигналов)
+    bump_on_commit(*_group_scopes(instance))
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.__dict__.get("group_id")
+    instance._loaded_text = instance.__dict__.get("text")
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+        stats.adjust(instance.author_id, posts_count=1)
+    if created or instance.text != instance._loaded_text:
+        search.index_post(instance.pk)
+        instance._loaded_text = instance.text
+    scopes = _post_scopes(instance)
+    old_group_id = instance._loaded_group_id
+    if old_group_id and old_group_id != instance.group_id:
+        scopes += [f"group:{slug}" for slug in Group.objects.filter(
+            pk=old_group_id).values_list("slug", flat=True)]
+    instance._loaded_group_id = instance.group_id
+    bump_on_commit(*scopes)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    stats.adjust(instance.author_id, posts_count=-1)
+    bump_on_commit(*_post_scopes(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.author_id)
+        stats.adjust(instance.author_id, followers_count=1)
+        stats.adjust(instance.user_id, following_count=1)
+        bump_on_commit(f"profile:{instance.author.username}",
+                       f"profile:{instance.user.username}",
+                       f"feed:{instance.user_id}")
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+    stats.adjust(instance.author_id, followers_count=-1)
+    stats.adjust(instance.user_id, following_count=-1)
+    bump_on_commit(f"profile:{instance.author.username}",
+                   f"profile:{instance.user.username}",
+                   f"feed:{instance.user_id}")
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.adjust(instance.author_id, comments_count=1)
+        search.add_comment(instance.post_id, instance.text)
+    else:
+        search.index_post(instance.post_id)
+    bump_on_commit(*post_id_scopes(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.adjust(instance.author_id, comments_count=-1)
+    search.remove_comment(instance.post_id, instance.text)
+    bump_on_commit(*post_id_scopes(instance.post_id))
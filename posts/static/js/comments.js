@@ -0,0 +1,27 @@
+// Подгрузка следующих страниц комментариев на странице поста
+$(function () {
+    $("#load-comments").on("click", function (event) {
+        event.preventDefault();
+        var button = $(this);
+        $.getJSON(button.data("url"), {after: button.data("after")}, function (data) {
+            data.comments.forEach(function (comment) {
+                var link = $("<a>")
+                    .attr({href: comment.author_url, name: "comment_" + comment.id})
+                    .text(comment.author);
+                $("#comments").append(
+                    $("<div class='media mb-4'>").append(
+                        $("<div class='media-body'>")
+                            .append($("<h5 class='mt-0'>").append(link))
+                            .append(document.createTextNode(comment.text))
+                    )
+                );
+            });
+            if (data.next) {
+                button.data("after", data.next)
+                    .attr("href", "?comments_after=" + data.next);
+            } else {
+                button.remove();
+            }
+        });
+    });
+});
@@ -0,0 +1,94 @@
+"""
+Счётчики профиля: посты, подписчики, подписки и комментарии.
+
+Счётчики меняются сигналами на каждое сохранение и удаление, поэтому
+страницы профиля и поста читают одну строку UserStats вместо трёх
+COUNT(*). Строка создаётся при первом чтении, а расхождения после
+массовых операций исправляет команда reconcile_stats.
+"""
+from django.db import IntegrityError
+from django.db.models import Count, F
+
+from .models import Comment, Follow, Post, User, UserStats
+
+COUNTERS = {
+    "posts_count": (Post, "author_id"),
+    "followers_count": (Follow, "author_id"),
+    "following_count": (Follow, "user_id"),
+    "comments_count": (Comment, "author_id"),
+}
+
+
+def adjust(user_id, **deltas):
+    """Атомарно сдвигает счётчики; отсутствующую строку не создаёт."""
+    adjust_many([user_id], **deltas)
+
+
+def adjust_many(user_ids, **deltas):
+    """Сдвигает счётчики нескольких пользователей одним UPDATE."""
+    UserStats.objects.filter(user_id__in=user_ids).update(**{
+        name: F(name) + delta for name, delta in deltas.items()
+    })
+
+
+def count_for(user_ids):
+    """Точные значения счётчиков для набора пользователей."""
+    result = {user_id: dict.fromkeys(COUNTERS, 0) for user_id in user_ids}
+    for name, (model, field) in COUNTERS.items():
+        # order_by() убирает Meta.ordering поста из GROUP BY, иначе строки
+        # группировались бы ещё и по pub_date
+        rows = model.objects.filter(**{f"{field}__in": user_ids}).\
+            order_by().values(field).annotate(total=Count("pk")).\
+            values_list(field, "total")
+        for user_id, total in rows:
+            result[user_id][name] = total
+    return result
+
+
+def get_stats(user):
+    """Счётчики пользователя; при отсутствии строки считает их заново."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+    counts = count_for([user.pk])[user.pk]
+    try:
+        stats, _ = UserStats.objects.get_or_create(user_id=user.pk,
+                                                   defaults=counts)
+    except IntegrityError:
+        stats = UserStats.objects.get(user_id=user.pk)
+    user.stats = stats
+    return stats
+
+
+def reconcile(batch_size=1000):
+    """Пересчитывает счётчики всех пользователей, возвращает число правок."""
+    fixed = 0
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+    batch = []
+    for user_id in user_ids.iterator():
+        batch.append(user_id)
+        if len(batch) >= batch_size:
+            fixed += _reconcile_batch(batch)
+            batch = []
+    if batch:
+        fixed += _reconcile_batch(batch)
+    return fixed
+
+
+def _reconcile_batch(user_ids):
+    counts = count_for(user_ids)
+    existing = UserStats.objects.in_bulk(user_ids)
+    to_create, to_update = [], []
+    for user_id, values in counts.items():
+        stats = existing.get(user_id)
+        if stats is None:
+            to_create.append(UserStats(user_id=user_id, **values))
+        elif any(getattr(stats, name) != value
+                 for name, value in values.items()):
+            for name, value in values.items():
+                setattr(stats, name, value)
+            to_update.append(stats)
+    UserStats.objects.bulk_create(to_create, ignore_conflicts=True)
+    UserStats.objects.bulk_update(to_update, list(COUNTERS))
+    return len(to_create) + len(to_update)
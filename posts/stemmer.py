@@ -0,0 +1,118 @@
+"""
+Стеммер Snowball для русского языка.
+
+Переписан по описанию алгоритма на snowballstem.org: окончания ищутся
+только в области RV (после первой гласной), словообразовательные суффиксы
+-ост/-ость — в области R2. Слова не на кириллице возвращаются как есть.
+"""
+from functools import lru_cache
+
+VOWELS = "аеиоуыэюя"
+
+
+def _endings(plain, after_a=()):
+    """Группа окончаний; after_a — те, что отрезаются только после а/я."""
+    return frozenset(after_a), frozenset(plain)
+
+
+PERFECTIVE_GERUND = _endings(
+    ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"),
+    after_a=("в", "вши", "вшись"),
+)
+ADJECTIVE = _endings(
+    ("ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем",
+     "им", "ым", "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю",
+     "ая", "яя", "ою", "ею"),
+)
+PARTICIPLE = _endings(("ивш", "ывш", "ующ"),
+                      after_a=("ем", "нн", "вш", "ющ", "щ"))
+REFLEXIVE = _endings(("ся", "сь"))
+VERB = _endings(
+    ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй",
+     "ил", "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют",
+     "ит", "ыт", "ены", "ить", "ыть", "ишь", "ую", "ю"),
+    after_a=("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но",
+             "ет", "ют", "ны", "ть", "ешь", "нно"),
+)
+NOUN = _endings(
+    ("а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии",
+     "и", "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам",
+     "ом", "о", "у", "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия",
+     "ья", "я"),
+)
+DERIVATIONAL = _endings(("ост", "ость"))
+SUPERLATIVE = _endings(("ейш", "ейше"))
+MAX_ENDING = 6
+
+
+def _regions(word):
+    """Начала областей RV и R2."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, endings):
+    """
+    Отрезает самое длинное окончание из группы, лежащее не левее start.
+    Окончания первой подгруппы отрезаются, только если перед ними «а» или
+    «я». Возвращает None, если отрезать нечего.
+    """
+    after_a, plain = endings
+    for length in range(min(MAX_ENDING, len(word) - start), 0, -1):
+        ending = word[-length:]
+        if ending in plain:
+            return word[:-length]
+        if ending in after_a:
+            cut = len(word) - length
+            if cut - 1 < start or word[cut - 1] not in "ая":
+                return None
+            return word[:cut]
+    return None
+
+
+def _adjectival(word, start):
+    stripped = _strip(word, start, ADJECTIVE)
+    if stripped is None:
+        return None
+    return _strip(stripped, start, PARTICIPLE) or stripped
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    word = word.lower().replace("ё", "е")
+    if not any("а" <= char <= "я" for char in word):
+        return word
+    rv, r2 = _regions(word)
+
+    stripped = _strip(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        stripped = (_adjectival(word, rv) or _strip(word, rv, VERB)
+                    or _strip(word, rv, NOUN))
+    word = stripped or word
+
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    elif superlative is None and word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
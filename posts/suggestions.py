@@ -0,0 +1,85 @@
+"""
+Рекомендации «на кого подписаться» (друзья друзей).
+
+Кандидаты пользователя — авторы, на которых подписаны те, на кого
+подписан он сам; вес кандидата — число таких общих подписок. Считать
+это на каждый запрос дорого (соединение Follow с самой собой), поэтому
+compute пересчитывает таблицу FollowSuggestion пачками пользователей, а
+страница рекомендаций читает готовые строки по индексу (user, -score).
+Тем, у кого друзей друзей меньше limit, список добивается самыми
+популярными авторами с весом 0.
+
+Подписки после пересчёта отфильтровываются при чтении.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .bulk import batched
+from .models import Follow, FollowSuggestion, User, UserStats
+
+
+def _popular(limit):
+    return list(UserStats.objects.order_by("-followers_count", "user_id").
+                values_list("user_id", flat=True)[:limit])
+
+
+def _compute_batch(user_ids, popular, limit):
+    followed = defaultdict(set)
+    for user_id, author_id in Follow.objects.filter(
+            user_id__in=user_ids).values_list("user_id", "author_id"):
+        followed[user_id].add(author_id)
+    # Строка запроса — подписка друга; user__following — подписки на
+    # этого друга, их user — пользователь, которому ищем рекомендации
+    rows = Follow.objects.filter(user__following__user_id__in=user_ids).\
+        values_list("user__following__user_id", "author_id").\
+        annotate(score=Count("id")).order_by()
+    candidates = defaultdict(list)
+    for user_id, author_id, score in rows:
+        if author_id != user_id and author_id not in followed[user_id]:
+            candidates[user_id].append((score, author_id))
+    suggestions = []
+    for user_id in user_ids:
+        best = sorted(candidates[user_id], key=lambda c: (-c[0], c[1]))
+        chosen = [author_id for _, author_id in best[:limit]]
+        for author_id in popular:
+            if len(chosen) >= limit:
+                break
+            if (author_id != user_id and author_id not in followed[user_id]
+                    and author_id not in chosen):
+                chosen.append(author_id)
+                best.append((0, author_id))
+        scores = {author_id: score for score, author_id in best}
+        suggestions += [
+            FollowSuggestion(user_id=user_id, author_id=author_id,
+                             score=scores[author_id])
+            for author_id in chosen
+        ]
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FollowSuggestion.objects.bulk_create(suggestions)
+    return len(suggestions)
+
+
+def compute(batch_size=500, limit=None, stdout=None):
+    """Пересчитывает рекомендации всех пользователей; возвращает их число."""
+    limit = limit or settings.SUGGESTIONS_PER_USER
+    popular = _popular(limit * 2)
+    total = 0
+    user_ids = User.objects.order_by("pk").values_list("pk", flat=True)
+    for batch in batched(user_ids.iterator(), batch_size):
+        total += _compute_batch(batch, popular, limit)
+        if stdout is not None:
+            stdout.write(f"Пользователей: до id {batch[-1]}, "
+                         f"рекомендаций: {total}")
+    return total
+
+
+def for_user(user, limit=None):
+    """Готовые рекомендации без авторов, на которых user уже подписан."""
+    suggestions = FollowSuggestion.objects.filter(user=user).\
+        exclude(author__following__user=user).select_related("author").\
+        order_by("-score", "author_id")
+    return suggestions[:limit or settings.SUGGESTIONS_PER_USER]
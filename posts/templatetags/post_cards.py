@@ -0,0 +1,65 @@
+import zlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from posts import images, thumbnails
+from yatube import metrics
+
+register = template.Library()
+
+
+def card_key(post, user):
+    """
+    Ключ фрагмента карточки: id поста, версия по времени правки и числу
+    комментариев, имя автора, время правки группы и варианты картинки (они
+    тоже выводятся в карточке), а также признак автора (у автора есть
+    ссылка на правку).
+    """
+    is_author = int(user.is_authenticated and user.pk == post.author_id)
+    comment_count = getattr(post, "comment_count", None)
+    group = post.group.updated.timestamp() if post.group_id else ""
+    variants = zlib.crc32(post.image_variants.encode())
+    return "post_card:%s:%s:%s:%s:%s:%s:%s" % (
+        post.pk, post.updated.timestamp(), comment_count, is_author,
+        group, variants, post.author.username,
+    )
+
+
+def render_cards(posts, user):
+    """Собирает карточки из кэша одним get_many, недостающие рендерит."""
+    keys = [card_key(post, user) for post in posts]
+    cached = cache.get_many(keys)
+    missing = {}
+    for post, key in zip(posts, keys):
+        if key not in cached:
+            missing[key] = render_to_string(
+                "includes/post_item.html", {"post": post, "user": user}
+            )
+    metrics.record_cache(hits=len(cached), misses=len(missing))
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+        cached.update(missing)
+    return mark_safe("".join(cached[key] for key in keys))
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    return render_cards(list(posts), context["user"])
+
+
+@register.simple_tag
+def post_thumbnail(post):
+    """URL готовой миниатюры; если её нет, ставит построение в очередь."""
+    url = thumbnails.thumbnail_url(post)
+    if url is None:
+        thumbnails.enqueue(post)
+    return url or ""
+
+
+@register.filter
+def image_srcset(post, extension):
+    return images.srcset(post.image_variants, extension)
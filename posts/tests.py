@@ -1,16 +1,45 @@
+import datetime as dt
 import io
+import json
+import os
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
 from PIL import Image
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.core.files.images import ImageFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client, override_settings
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import TestCase, Client, RequestFactory, override_settings
 from .models import *
 from .forms import *
-from django.urls import reverse
+from . import (comment_writer, generate, images, suggestions, thumbnails,
+               transfer, trending)
+from .cache import get_versions, page_key
+from .management.commands import warm_thumbnails
+from .paginators import CursorPaginator, InvalidCursor, encode_cursor
+from .search import find
+from .templatetags.post_cards import card_key, render_cards
+from .uploadhandlers import SizeLimitedUploadHandler
+from django.urls import resolve, reverse
+from django.utils import timezone
+from yatube import metrics
+from yatube.querylog import QueryBudgetExceeded, fingerprint, query_budget
+from yatube.routers import ReplicaRouter, ReplicaRoutingMiddleware
+from yatube.sqlite_cache import SQLiteCache
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import Count, F
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 
 
 
@@ -376,3 +405,1435 @@ class TestFollow(TestCase):
         self.assertEqual(step.status_code, 200)
         self.assertNotContains(step, self.text)
         self.assertNotContains(step, self.user_following)
+
+
+class TestFeed(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="writer")
+        self.client.force_login(self.reader)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        old_post = Post.objects.create(text="old", author=self.author)
+        self.client.get(reverse("profile_follow",
+                                kwargs={"username": self.author.username}))
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post=old_post).exists())
+        self.client.get(reverse("profile_unfollow",
+                                kwargs={"username": self.author.username}))
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+
+    def test_new_post_fans_out(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text="fresh", author=self.author)
+        entry = FeedEntry.objects.get(user=self.reader)
+        self.assertEqual(entry.post, post)
+        self.assertEqual(entry.pub_date, post.pub_date)
+        response = self.client.get(reverse("follow_index"))
+        self.assertEqual(list(response.context["page"]), [post])
+
+    def test_rebuild_feeds(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text="one", author=self.author)
+        FeedEntry.objects.all().delete()
+        call_command("rebuild_feeds", stdout=io.StringIO())
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 1)
+
+
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="pager")
+        self.posts = [Post.objects.create(text=f"post {i}", author=self.user)
+                      for i in range(25)]
+        Post.objects.update(pub_date=self.posts[0].pub_date)
+        self.newest_first = sorted(self.posts, key=lambda p: -p.id)
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        first = paginator.get_page()
+        self.assertEqual(list(first), self.newest_first[:10])
+        self.assertFalse(first.has_previous())
+        second = paginator.get_page(after=first.next_cursor)
+        self.assertEqual(list(second), self.newest_first[10:20])
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual(list(third), self.newest_first[20:])
+        self.assertFalse(third.has_next())
+        back = paginator.get_page(before=third.previous_cursor)
+        self.assertEqual(list(back), self.newest_first[10:20])
+
+    def test_view_renders_cursor_links_without_count(self):
+        cache.clear()
+        first = CursorPaginator(Post.objects.all(), 10).get_page()
+        response = self.client.get(reverse("index"),
+                                   {"after": first.next_cursor})
+        self.assertEqual(list(response.context["page"]),
+                         self.newest_first[10:20])
+        self.assertContains(response, "?after=")
+        self.assertContains(response, "?before=")
+        self.assertNotIn("count", response.context["paginator"].__dict__)
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        cache.clear()
+        response = self.client.get(reverse("index"), {"after": "broken!"})
+        self.assertEqual(list(response.context["page"]),
+                         self.newest_first[:10])
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        pub_date = self.posts[0].pub_date
+        tampered = [encode_cursor(["abc", 1]),
+                    encode_cursor([pub_date, "abc"]),
+                    encode_cursor([pub_date, None]),
+                    encode_cursor([pub_date, [1]]),
+                    encode_cursor([pub_date]),
+                    encode_cursor({"id": 1})]
+        paginator = CursorPaginator(Post.objects.all(), 10)
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                cache.clear()
+                response = self.client.get(reverse("index"),
+                                           {"after": cursor})
+                self.assertEqual(list(response.context["page"]),
+                                 self.newest_first[:10])
+                with self.assertRaises(InvalidCursor):
+                    paginator.get_page(after=cursor, strict=True)
+
+
+class TestFeedQueries(TestCase):
+    """Число запросов лент не должно зависеть от числа постов на странице."""
+
+    def setUp(self):
+        self.reader = User.objects.create_user(username="reader")
+        self.client.force_login(self.reader)
+
+    def _fill(self, count, prefix="author"):
+        for i in range(count):
+            author = User.objects.create_user(username=f"{prefix}{i}")
+            group = Group.objects.create(title=f"{prefix}{i}",
+                                         slug=f"{prefix}{i}")
+            post = Post.objects.create(text=f"post {i}", author=author,
+                                       group=group)
+            Comment.objects.create(post=post, author=self.reader, text="hi")
+            Follow.objects.create(user=self.reader, author=author)
+        return post
+
+    def _urls(self, post):
+        return {
+            "index": reverse("index"),
+            "group_posts": reverse("group_posts",
+                                   kwargs={"slug": post.group.slug}),
+            "profile": reverse("profile",
+                               kwargs={"username": post.author.username}),
+            "follow_index": reverse("follow_index"),
+        }
+
+    def _count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        post = self._fill(2)
+        small = {name: self._count_queries(url)
+                 for name, url in self._urls(post).items()}
+        self._fill(8, prefix="more")
+        for name, url in self._urls(post).items():
+            with self.subTest(view=name):
+                self.assertEqual(self._count_queries(url), small[name])
+
+    def test_pinned_query_counts(self):
+        post = self._fill(10)
+        budgets = {"index": 4, "group_posts": 5, "profile": 5,
+                   "follow_index": 4}
+        for name, url in self._urls(post).items():
+            with self.subTest(view=name):
+                cache.clear()
+                with self.assertNumQueries(budgets[name]):
+                    self.client.get(url)
+
+
+class TestUserStats(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author")
+        self.reader = User.objects.create_user(username="reader")
+
+    def _stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_signals_keep_counters(self):
+        post = Post.objects.create(text="text", author=self.author)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        Comment.objects.create(post=post, author=self.reader, text="hi")
+        author_stats, reader_stats = (self._stats(self.author),
+                                      self._stats(self.reader))
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        self.assertEqual(reader_stats.comments_count, 1)
+        follow.delete()
+        post.delete()
+        author_stats, reader_stats = (self._stats(self.author),
+                                      self._stats(self.reader))
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+        self.assertEqual(reader_stats.comments_count, 0)
+
+    def test_profile_reads_counters(self):
+        Post.objects.create(text="text", author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(
+            reverse("profile", kwargs={"username": self.author.username}))
+        self.assertEqual(response.context["count"], 1)
+        self.assertEqual(response.context["following"], 1)
+        self.assertEqual(response.context["subscriptions"], 0)
+
+    def test_reconcile_fixes_drift(self):
+        Post.objects.create(text="text", author=self.author)
+        Post.objects.create(text="more", author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command("reconcile_stats", stdout=io.StringIO())
+        self.assertEqual(self._stats(self.author).posts_count, 2)
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+
+class TestPostCardCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="carder")
+        self.client.force_login(self.user)
+        self.first = Post.objects.create(text="first", author=self.user)
+        self.second = Post.objects.create(text="second", author=self.user)
+
+    def _feed(self):
+        return list(Post.objects.for_feed())
+
+    def test_cards_are_cached_per_post(self):
+        render_cards(self._feed(), self.user)
+        keys = [card_key(post, self.user) for post in self._feed()]
+        self.assertEqual(len(cache.get_many(keys)), 2)
+
+    def test_edit_invalidates_only_edited_card(self):
+        before = {post.pk: card_key(post, self.user) for post in self._feed()}
+        render_cards(self._feed(), self.user)
+        self.client.post(
+            reverse("post_edit", kwargs={"username": self.user.username,
+                                         "post_id": self.first.id}),
+            data={"text": "edited"},
+        )
+        posts = self._feed()
+        after = {post.pk: card_key(post, self.user) for post in posts}
+        self.assertEqual(after[self.second.pk], before[self.second.pk])
+        self.assertNotEqual(after[self.first.pk], before[self.first.pk])
+        self.assertIn("edited", render_cards(posts, self.user))
+
+    def test_group_and_author_renames_change_card(self):
+        group = Group.objects.create(title="Старое", slug="cards")
+        Post.objects.filter(pk=self.first.pk).update(group=group)
+        render_cards(self._feed(), self.user)
+        group.title = "Новое"
+        group.save()
+        self.assertIn("Новое", render_cards(self._feed(), self.user))
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertIn("@renamed", render_cards(self._feed(), self.user))
+
+    def test_author_and_reader_get_different_cards(self):
+        reader = User.objects.create_user(username="reader")
+        post = self._feed()[0]
+        self.assertIn("Редактировать", render_cards([post], self.user))
+        self.assertNotIn("Редактировать", render_cards([post], reader))
+
+
+class TestVersionedPageCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="cacher")
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+        self.group = Group.objects.create(title="g", slug="g")
+
+    def test_index_is_served_from_cache(self):
+        self.client.get(reverse("index"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("index"))
+
+    def test_new_post_invalidates_index_group_and_profile(self):
+        urls = (reverse("index"),
+                reverse("group_posts", kwargs={"slug": self.group.slug}),
+                reverse("profile", kwargs={"username": self.user.username}))
+        for url in urls:
+            self.auth_client.get(url)
+        Post.objects.create(text="brand new", author=self.user,
+                            group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.auth_client.get(url), "brand new")
+
+    def test_group_edit_invalidates_group_pages(self):
+        url = reverse("group_posts", kwargs={"slug": "g"})
+        self.client.get(url)
+        self.group.title = "Новое название"
+        self.group.save()
+        self.assertContains(self.client.get(url), "Новое название")
+        self.group.slug = "renamed"
+        self.group.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_user_edit_invalidates_profile(self):
+        url = reverse("profile", kwargs={"username": "cacher"})
+        self.client.get(url)
+        versions = get_versions(["profile:cacher", "index"])
+        self.user.last_login = timezone.now()
+        self.user.save()
+        self.assertEqual(get_versions(["profile:cacher", "index"]), versions)
+        self.user.first_name = "Алиса"
+        self.user.save()
+        self.assertContains(self.client.get(url), "Алиса")
+        self.user.username = "alice"
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_comment_invalidates_index(self):
+        post = Post.objects.create(text="text", author=self.user)
+        self.client.get(reverse("index"))
+        Comment.objects.create(post=post, author=self.user, text="hi")
+        self.assertContains(self.client.get(reverse("index")),
+                            "1 комментариев")
+
+    def test_guest_and_user_pages_do_not_collide(self):
+        self.auth_client.get(reverse("index"))
+        response = self.client.get(reverse("index"))
+        self.assertNotContains(response, self.user.username)
+
+    @override_settings(PAGE_CACHE_LOCK_WAIT=0)
+    def test_held_lock_falls_back_to_rendering(self):
+        request = RequestFactory().get("/")
+        key = page_key(request, ["index"])
+        cache.add(key + ":lock", 1)
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(cache.get(key))
+
+    @override_settings(PAGE_ETAGS=True)
+    def test_group_rename_changes_etag(self):
+        url = reverse("group_posts", kwargs={"slug": "g"})
+        etag = self.client.get(url)["ETag"]
+        self.group.title = "Новое название"
+        self.group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Новое название")
+
+    def test_no_etag_with_process_local_cache(self):
+        response = self.client.get(reverse("index"))
+        self.assertFalse(response.has_header("ETag"))
+        self.assertIn("no-cache", response["Cache-Control"])
+        response = self.client.get(reverse("index"), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PAGE_ETAGS=True)
+    def test_unchanged_page_answers_304(self):
+        response = self.client.get(reverse("index"))
+        etag = response["ETag"]
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("index"),
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        Post.objects.create(text="brand new", author=self.user)
+        response = self.client.get(reverse("index"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    @override_settings(PAGE_ETAGS=True)
+    def test_session_pages_are_private(self):
+        anonymous = self.client.get(reverse("index"))
+        response = self.auth_client.get(reverse("index"))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertNotEqual(response["ETag"], anonymous["ETag"])
+        response = self.auth_client.get(
+            reverse("index"), HTTP_IF_NONE_MATCH=anonymous["ETag"])
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(PAGE_ETAGS=True)
+    def test_post_page_revalidates_after_comment(self):
+        post = Post.objects.create(text="text", author=self.user)
+        url = reverse("post", args=[self.user.username, post.id])
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(post=post, author=self.user, text="hi")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "hi")
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="photographer")
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory):
+                with open("media/file.jpg", "rb") as img:
+                    post = Post.objects.create(
+                        text="photo", author=self.user,
+                        image=SimpleUploadedFile("file.jpg", img.read()))
+                post = Post.objects.for_feed().get(pk=post.pk)
+                self.assertIn("placeholder.svg",
+                              render_cards([post], self.user))
+                url = thumbnails.generate(post.image.name)
+                self.assertEqual(thumbnails.thumbnail_url(post), url)
+                cache.delete(card_key(post, self.user))
+                html = render_cards([post], self.user)
+                self.assertIn(url, html)
+                self.assertNotIn("placeholder.svg", html)
+
+    def test_process_builds_responsive_variants(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory,
+                                   POST_IMAGE_WIDTHS=[320, 640, 100000]):
+                with open("media/file.jpg", "rb") as img:
+                    post = Post.objects.create(
+                        text="photo", author=self.user,
+                        image=SimpleUploadedFile("file.jpg", img.read()))
+                self.assertTrue(thumbnails.process(post.pk, post.image.name))
+                post.refresh_from_db()
+                srcset = images.srcset(post.image_variants, "webp")
+                self.assertIn("_320.webp 320w", srcset)
+                self.assertNotIn("100000w", srcset)
+                data = json.loads(post.image_variants)
+                for width in data["widths"]:
+                    for extension in ("webp", "jpg"):
+                        self.assertTrue(os.path.exists(os.path.join(
+                            temp_directory, images.variant_name(
+                                data["digest"], width, extension))))
+                html = render_cards([Post.objects.for_feed().get(
+                    pk=post.pk)], self.user)
+                self.assertIn('type="image/webp"', html)
+
+    def test_readiness_survives_cache_clear(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory):
+                with open("media/file.jpg", "rb") as img:
+                    post = Post.objects.create(
+                        text="photo", author=self.user,
+                        image=SimpleUploadedFile("file.jpg", img.read()))
+                updated = post.updated
+                self.assertTrue(thumbnails.process(post.pk, post.image.name))
+                cache.clear()
+                post = Post.objects.for_feed().get(pk=post.pk)
+                self.assertEqual(post.updated, updated)
+                with mock.patch.object(thumbnails, "enqueue") as enqueue:
+                    html = render_cards([post], self.user)
+                enqueue.assert_not_called()
+                self.assertNotIn("placeholder.svg", html)
+                self.assertIn(thumbnails.thumbnail_url(post), html)
+
+
+    def test_warm_thumbnails_keeps_bounded_window(self):
+        read = []
+
+        def rows():
+            for number in range(100):
+                read.append(number)
+                yield number, f"posts/{number}.jpg"
+
+        with mock.patch.object(thumbnails, "process_in_thread",
+                               return_value=True), \
+                ThreadPoolExecutor(2) as pool:
+            results = warm_thumbnails._results(pool, rows(), 8)
+            next(results)
+            self.assertEqual(len(read), 8)
+            self.assertEqual(sum(results), 99)
+
+
+class TestImageUpload(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="uploader")
+        self.client.force_login(self.user)
+
+    def upload(self, image, name="photo.jpg"):
+        return self.client.post(reverse("new_post"), data={
+            "text": "photo", "image": SimpleUploadedFile(name, image)})
+
+    def encode(self, image, image_format="JPEG", **options):
+        buffer = io.BytesIO()
+        image.save(buffer, image_format, **options)
+        return buffer.getvalue()
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_oversized_upload_is_rejected(self):
+        with open("media/file.jpg", "rb") as img:
+            response = self.upload(img.read())
+        self.assertFormError(response, form="form", field="image",
+                             errors="Файл больше 1,0\xa0КБ.")
+        self.assertEqual(Post.objects.count(), 0)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100 * 100)
+    def test_too_many_pixels_is_rejected(self):
+        image = self.encode(Image.new("1", (200, 200)), "PNG")
+        response = self.upload(image, "bomb.png")
+        self.assertFormError(response, form="form", field="image",
+                             errors="Слишком большое разрешение изображения.")
+        self.assertEqual(Post.objects.count(), 0)
+
+    def test_exif_is_stripped_and_image_downscaled(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повернуть на 90° по часовой
+        exif[0x010F] = "Camera"
+        image = self.encode(Image.new("RGB", (400, 200), "red"), exif=exif)
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory,
+                                   POST_IMAGE_MAX_DIMENSION=100,
+                                   THUMBNAIL_WORKERS=0):
+                self.upload(image)
+                post = Post.objects.get()
+                with Image.open(post.image.path) as saved:
+                    self.assertEqual(saved.size, (50, 100))
+                    self.assertFalse(saved.getexif())
+                self.assertEqual((post.image.width, post.image.height),
+                                 (50, 100))
+
+    def test_upload_streams_to_temporary_file(self):
+        handler = SizeLimitedUploadHandler()
+        handler.new_file("image", "photo.jpg", "image/jpeg", None)
+        with self.settings(POST_IMAGE_MAX_UPLOAD_SIZE=4):
+            handler.receive_data_chunk(b"abc", 0)
+            handler.receive_data_chunk(b"def", 3)
+        upload = handler.file_complete(6)
+        self.assertTrue(os.path.exists(upload.temporary_file_path()))
+        self.assertTrue(upload.oversized)
+        self.assertEqual(upload.read(), b"")
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=1024)
+    def test_streamed_oversized_upload_reports_size(self):
+        form = PostForm(
+            data={"text": "photo"},
+            files={"image": SimpleUploadedFile("photo.jpg", b"")},
+        )
+        form.files["image"].oversized = True
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["image"], ["Файл больше 1,0\xa0КБ."])
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.cats = Post.objects.create(
+            text="Мои кошки спят на тёплом подоконнике", author=self.user)
+        self.dogs = Post.objects.create(
+            text="Собака гуляла во дворе", author=self.user)
+
+    def test_stemmer_handles_russian_forms(self):
+        self.assertEqual(find("кошками"), [self.cats.pk])
+        self.assertEqual(find("тёплые подоконники"), [self.cats.pk])
+        self.assertEqual(find("кошка собака"), [])
+        self.assertEqual(find("и на"), [])
+
+    def test_text_ranks_above_comments(self):
+        Comment.objects.create(post=self.dogs, author=self.user,
+                               text="А у меня тоже кошка")
+        self.assertEqual(find("кошка"), [self.cats.pk, self.dogs.pk])
+
+    def test_index_follows_comments_and_edits(self):
+        comment = Comment.objects.create(post=self.dogs, author=self.user,
+                                         text="Какая гладкая шерсть")
+        self.assertEqual(find("шерсть"), [self.dogs.pk])
+        comment.delete()
+        self.assertEqual(find("шерсть"), [])
+        self.cats.text = "Теперь здесь про шерсть"
+        self.cats.save()
+        self.assertEqual(find("шерсть"), [self.cats.pk])
+        self.assertEqual(find("кошки"), [])
+        self.dogs.delete()
+        self.assertFalse(SearchTerm.objects.filter(post_id=self.dogs.pk))
+
+    def test_rebuild_matches_incremental_index(self):
+        Comment.objects.create(post=self.cats, author=self.user,
+                               text="Кошки любят спать")
+        incremental = set(SearchTerm.objects.values_list(
+            "term", "post", "weight"))
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(set(SearchTerm.objects.values_list(
+            "term", "post", "weight")), incremental)
+
+    def test_search_view(self):
+        for number in range(11):
+            Post.objects.create(text=f"Кошка номер {number}",
+                                author=self.user)
+        response = self.client.get(reverse("search"), {"q": "кошки"})
+        self.assertEqual(len(response.context["posts"]), 10)
+        self.assertContains(response, "?q=%D0%BA%D0%BE%D1%88%D0%BA%D0%B8&amp;page=2")
+        response = self.client.get(reverse("search"), {"q": "слон"})
+        self.assertContains(response, "ничего не найдено")
+
+
+@override_settings(COMMENTS_PER_PAGE=5)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="talker")
+        self.post = Post.objects.create(text="Обсуждаем", author=self.user)
+
+    def add_comments(self, count):
+        readers = [User.objects.create_user(username=f"reader{number}")
+                   for number in range(count)]
+        for number, reader in enumerate(readers):
+            Comment.objects.create(post=self.post, author=reader,
+                                   text=f"комментарий {number}")
+
+    def post_url(self):
+        return reverse("post", args=[self.user.username, self.post.id])
+
+    def test_query_count_does_not_grow_with_comments(self):
+        self.add_comments(3)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.post_url())
+        for number in range(12):
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text=f"ещё {number}")
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.post_url())
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len(response.context["items"]), 5)
+        self.assertContains(response, "load-comments")
+        self.assertIsNone(response.context["comments"]._result_cache)
+
+    def test_json_endpoint_walks_all_comments(self):
+        self.add_comments(12)
+        response = self.client.get(self.post_url())
+        texts = [item.text for item in response.context["items"]]
+        cursor = response.context["items"].next_cursor
+        url = reverse("post_comments", args=[self.user.username, self.post.id])
+        while cursor:
+            data = self.client.get(url, {"after": cursor}).json()
+            texts += [comment["text"] for comment in data["comments"]]
+            cursor = data["next"]
+        self.assertEqual(texts, [f"комментарий {n}" for n in range(12)])
+        self.assertEqual(data["comments"][-1]["author"], "reader11")
+
+    def test_json_endpoint_checks_author(self):
+        url = reverse("post_comments", args=["stranger", self.post.id])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class TestDataTransfer(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="reader")
+        self.group = Group.objects.create(title="Котики", slug="cats",
+                                          description="про котиков")
+        self.posts = [
+            Post.objects.create(text=f"Пост про кота {number}",
+                                author=self.author,
+                                group=self.group if number % 2 else None)
+            for number in range(5)
+        ]
+        Comment.objects.create(post=self.posts[0], author=self.reader,
+                               text="Хороший кот")
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def snapshot(self):
+        return (
+            sorted(Post.objects.values_list(
+                "text", "author__username", "group__slug", "pub_date")),
+            sorted(Comment.objects.values_list(
+                "post__text", "author__username", "text", "created")),
+            sorted(Follow.objects.values_list(
+                "user__username", "author__username")),
+        )
+
+    def export(self):
+        output = io.StringIO()
+        call_command("export_data", stdout=output)
+        return output.getvalue().splitlines(keepends=True)
+
+    def test_round_trip(self):
+        lines = self.export()
+        self.assertEqual(len(lines), 2 + 1 + 5 + 1 + 1)
+        expected = self.snapshot()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        transfer.load(lines, chunk_size=3)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(User.objects.count(), 2)
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.stats.following_count, 1)
+        self.assertEqual(self.reader.feed.count(), 5)
+        self.assertEqual(len(find("кот")), 5)
+
+    def test_resume_after_failure(self):
+        lines = self.export()
+        expected = self.snapshot()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+
+        def broken(lines):
+            yield from lines[:6]
+            raise IOError("обрыв")
+
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, "import.checkpoint")
+            with self.assertRaises(IOError):
+                transfer.load(broken(lines), checkpoint, chunk_size=2)
+            self.assertEqual(Post.objects.count(), 3)
+            transfer.load(lines, checkpoint, chunk_size=4)
+            self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(self.snapshot(), expected)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def route(self, method, url, cookies=None, write=False):
+        """Прогоняет запрос через middleware и запоминает выбор базы."""
+        request = getattr(RequestFactory(), method)(url)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(url)
+        seen = {}
+
+        def get_response(request):
+            middleware.process_view(request, None, (), {})
+            seen["post"] = self.router.db_for_read(Post)
+            seen["session"] = self.router.db_for_read(Session)
+            if write:
+                seen["write"] = self.router.db_for_write(Post)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return seen, middleware(request)
+
+    def test_read_views_go_to_replica(self):
+        seen, response = self.route("get", reverse("index"))
+        self.assertEqual(seen, {"post": "replica", "session": "default"})
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        seen, _ = self.route("get", reverse("new_post"))
+        self.assertEqual(seen["post"], "default")
+        self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_write_makes_reads_sticky(self):
+        url = reverse("add_comment", args=["someone", 1])
+        seen, response = self.route("post", url, write=True)
+        self.assertEqual(seen["write"], "default")
+        cookie = response.cookies[settings.REPLICA_STICKY_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_STICKY_SECONDS)
+        seen, _ = self.route("get", reverse("index"),
+                             cookies={cookie.key: cookie.value})
+        self.assertEqual(seen["post"], "default")
+
+    def test_get_that_writes_is_sticky_too(self):
+        url = reverse("profile_follow", args=["someone"])
+        _, response = self.route("get", url, write=True)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_default(self):
+        seen, response = self.route("post", reverse("index"), write=True)
+        self.assertEqual(seen["post"], "default")
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+
+class TestSqliteProfiles(TestCase):
+    def open(self, path, profile):
+        """Новое соединение с файлом базы, PRAGMA выставляет хук."""
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, "NAME": path}, alias="profile")
+        with override_settings(DB_PROFILE=profile):
+            wrapper.ensure_connection()
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_production_profile_applies_pragmas(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.open(os.path.join(directory, "db"), "production")
+            self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+            self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+            self.assertEqual(self.pragma(wrapper, "cache_size"), -64 * 1024)
+            wrapper.close()
+
+    def test_default_profile_keeps_connection_untouched(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = self.open(os.path.join(directory, "db"), "default")
+            self.assertEqual(self.pragma(wrapper, "journal_mode"), "delete")
+            self.assertEqual(self.pragma(wrapper, "synchronous"), 2)
+            wrapper.close()
+        self.assertEqual(
+            settings.SQLITE_PROFILES[settings.DB_PROFILE]["CONN_MAX_AGE"],
+            settings.DATABASES["default"]["CONN_MAX_AGE"],
+        )
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+        self.cache = self.open()
+
+    def open(self, **options):
+        return SQLiteCache(self.path, {"OPTIONS": options})
+
+    def test_values_round_trip(self):
+        self.cache.set("page", {"html": "<p>Пост</p>"})
+        self.cache.set("version", 3)
+        self.assertEqual(self.cache.get("page"), {"html": "<p>Пост</p>"})
+        self.assertEqual(self.cache.incr("version"), 4)
+        self.assertEqual(self.cache.get("version"), 4)
+        self.assertIsNone(self.cache.get("missing"))
+        with self.assertRaises(ValueError):
+            self.cache.incr("missing")
+
+    def test_writes_are_visible_to_other_instances(self):
+        other = self.open()
+        self.cache.set("version", 1)
+        self.assertEqual(other.get("version"), 1)
+        other.delete("version")
+        self.assertIsNone(self.cache.get("version"))
+
+    def test_add_only_when_missing_or_expired(self):
+        self.assertTrue(self.cache.add("lock", 1))
+        self.assertFalse(self.open().add("lock", 2))
+        self.assertEqual(self.cache.get("lock"), 1)
+        self.cache.set("lock", 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertFalse(self.cache.has_key("lock"))
+        self.assertTrue(self.cache.add("lock", 2))
+        self.assertEqual(self.cache.get("lock"), 2)
+
+    def test_atomic_operations_avoid_new_sqlite_syntax(self):
+        statements = []
+        self.cache._db.set_trace_callback(statements.append)
+        self.cache.add("version", 1)
+        self.cache.add("version", 2)
+        self.cache.incr("version")
+        sql = " ".join(statements).upper()
+        self.assertNotIn("RETURNING", sql)
+        self.assertNotIn("ON CONFLICT", sql)
+        self.assertEqual(self.cache.get("version"), 2)
+
+    def test_cull_evicts_least_recently_read(self):
+        cache = self.open(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache.set_many({f"key{number}": number for number in range(12)})
+        db = cache._db
+        db.execute("UPDATE cache SET accessed = 0")
+        db.execute("UPDATE cache SET accessed = 1 WHERE key LIKE '%key11'")
+        cache._cull(time.time())
+        left = cache.get_many([f"key{number}" for number in range(12)])
+        self.assertEqual(len(left), 6)
+        self.assertIn("key11", left)
+
+
+@override_settings(API_PAGE_SIZE=3)
+class TestFeedApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="subscriber")
+        self.group = Group.objects.create(title="Новости", slug="news",
+                                          description="Новости")
+        self.posts = [
+            Post.objects.create(text=f"пост {number}", author=self.author,
+                                group=self.group)
+            for number in range(5)
+        ]
+
+    def test_feed_pages_with_cursor(self):
+        url = reverse("api_group_posts", args=["news"])
+        data = self.client.get(url).json()
+        ids = [post["id"] for post in data["results"]]
+        data = self.client.get(url, {"after": data["next"]}).json()
+        ids += [post["id"] for post in data["results"]]
+        self.assertIsNone(data["next"])
+        self.assertEqual(ids, [post.id for post in reversed(self.posts)])
+        self.assertEqual(data["results"][0]["author"], "writer")
+        self.assertEqual(data["results"][0]["group"], "news")
+
+    def test_unchanged_feed_answers_304_from_aggregates(self):
+        url = reverse("api_profile", args=["writer"])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertIn("no-cache", response["Cache-Control"])
+        with self.assertNumQueries(4):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(text="свежий", author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["results"][0]["text"], "свежий")
+
+    def test_etag_follows_rows_not_cache_versions(self):
+        url = reverse("api_group_posts", args=["news"])
+        etag = self.client.get(url)["ETag"]
+        # UPDATE без сигналов, как правка из другого процесса: версии в
+        # кэше этого процесса не меняются
+        Post.objects.filter(pk=self.posts[0].pk).update(
+            text="правка", updated=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.group.title = "Другое"
+        self.group.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        Post.objects.filter(pk=self.posts[1].pk).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_etag_changes_with_comments(self):
+        post = self.posts[0]
+        url = reverse("api_post", args=[post.id])
+        etag = self.client.get(url)["ETag"]
+        Comment.objects.create(post=post, author=self.reader, text="Ого")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["comment_count"], 1)
+        self.assertEqual(data["comments"][0]["text"], "Ого")
+
+    def test_follow_feed_requires_login_and_tracks_new_posts(self):
+        url = reverse("api_follow_index")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), 3)
+        self.assertIn("Cookie", response["Vary"])
+        etag = response["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Post.objects.create(text="для подписчиков", author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["text"],
+                         "для подписчиков")
+
+    def test_tampered_cursor_is_bad_request(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        urls = [reverse("api_index"),
+                reverse("api_post", args=[self.posts[0].id]),
+                reverse("api_follow_index")]
+        for url in urls:
+            for cursor in (encode_cursor(["abc", 1]),
+                           encode_cursor([self.posts[0].pub_date, "x"]),
+                           "broken!"):
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {"after": cursor})
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("detail", response.json())
+
+    def test_unknown_objects_and_writes(self):
+        response = self.client.get(reverse("api_group_posts", args=["none"]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn("detail", response.json())
+        response = self.client.post(reverse("api_index"))
+        self.assertEqual(response.status_code, 405)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username="measured")
+        Post.objects.create(text="пост", author=self.user)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_counts_queries_and_cache(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("index"))
+        timing = response["Server-Timing"]
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        self.assertIn("tpl;dur=", timing)
+        self.assertIn('cache;desc="hit 0 miss 2"', timing)
+        timing = self.client.get(reverse("index"))["Server-Timing"]
+        self.assertIn('desc="0 queries"', timing)
+        self.assertIn('cache;desc="hit 1 miss 0"', timing)
+        self.assertNotIn("tpl;", timing)
+
+    def test_server_timing_is_off_by_default(self):
+        response = self.client.get(reverse("index"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_endpoint_reports_histograms_per_url_name(self):
+        for _ in range(3):
+            self.client.get(reverse("index"))
+        self.client.get(reverse("profile", args=["measured"]))
+        response = self.client.get(reverse("metrics"),
+                                   HTTP_AUTHORIZATION="Bearer secret")
+        text = response.content.decode()
+        self.assertIn('yatube_request_duration_seconds_count{view="index",',
+                      text)
+        self.assertRegex(
+            text, r'duration_seconds_bucket\{view="index",pid="\d+",'
+                  r'le="\+Inf"\} 3')
+        self.assertRegex(text, r'yatube_queries_total\{view="profile",'
+                               r'pid="\d+"\} [1-9]')
+        self.assertEqual(self.client.get(reverse("metrics")).status_code,
+                         404)
+        response = self.client.get(reverse("metrics"),
+                                   HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 404)
+
+    def test_timed_outside_request_goes_to_background(self):
+        with metrics.timed("thumbnail"):
+            with metrics.timed("thumbnail"):
+                pass
+        self.assertEqual(
+            metrics.registry.views["background:thumbnail"].count, 1)
+
+
+class TestQueryLog(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="looper")
+        for number in range(3):
+            Post.objects.create(text=f"пост {number}", author=self.user)
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) LIMIT 21'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s)  LIMIT 5'),
+        )
+
+    def test_budget_reports_repeated_queries_with_origin(self):
+        with self.assertRaises(QueryBudgetExceeded) as error:
+            with query_budget(max_repeats=1):
+                for post in Post.objects.all():
+                    post.author.username
+        self.assertIn("3 × SELECT", str(error.exception))
+        self.assertIn("posts/tests.py:", str(error.exception))
+        with query_budget(max_queries=1, max_repeats=1):
+            [post.author.username for post in Post.objects.for_feed()]
+
+    def test_origin_names_template(self):
+        posts = list(Post.objects.all())
+        with self.assertRaises(QueryBudgetExceeded) as error:
+            with query_budget(max_repeats=1):
+                for post in posts:
+                    render_to_string("includes/post_item.html",
+                                     {"post": post, "user": self.user})
+        self.assertIn("(includes/post_item.html)", str(error.exception))
+
+    @override_settings(SLOW_QUERY_MS=0)
+    def test_slow_queries_are_logged_with_view_origin(self):
+        with self.assertLogs("yatube.queries", "WARNING") as logs:
+            self.client.get(reverse("profile", args=["looper"]))
+        self.assertTrue(any("posts/views.py:" in line
+                            for line in logs.output))
+
+    def test_feeds_have_no_repeated_queries(self):
+        self.client.force_login(self.user)
+        for url in (reverse("index"), reverse("profile", args=["looper"]),
+                    reverse("follow_index")):
+            with self.subTest(url=url), query_budget(max_repeats=1):
+                self.client.get(url)
+
+
+class TestGenerateData(TestCase):
+    def run_generate(self, workers, **options):
+        return generate.generate(
+            users=40, posts=300, comments=200, follows=5, groups=4,
+            end=timezone.now(), workers=workers, rebuild=False, **options)
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by("id").values_list(
+                "author__username", "group__slug", "text")),
+            list(Comment.objects.order_by("id").values_list(
+                "post__text", "author__username", "text")),
+            sorted(Follow.objects.values_list(
+                "user__username", "author__username")),
+        )
+
+    def test_same_data_for_any_number_of_workers(self):
+        self.run_generate(workers=1)
+        expected = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        totals = self.run_generate(workers=3)
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(totals["posts"], 300)
+        self.assertEqual(totals["follows"], Follow.objects.count())
+
+    def test_popular_users_are_skewed(self):
+        self.run_generate(workers=2)
+        followers = list(User.objects.annotate(
+            total=Count("following")).order_by("id").values_list(
+            "total", flat=True))
+        self.assertGreater(followers[0], 5 * followers[-1] + 5)
+        self.assertFalse(Follow.objects.filter(user=F("author")).exists())
+        top = Post.objects.values("group").annotate(total=Count("id")).\
+            exclude(group=None).order_by("-total")
+        self.assertGreater(top[0]["total"], top[len(top) - 1]["total"])
+
+    def test_prefix_must_be_new(self):
+        self.run_generate(workers=1)
+        with self.assertRaises(ValueError):
+            self.run_generate(workers=1)
+
+    def test_impossible_sizes_are_rejected_before_writing(self):
+        for sizes in ({"users": 0}, {"posts": 0}, {"comments": -1}):
+            options = {"users": 40, "posts": 300, "comments": 200, **sizes}
+            with self.subTest(**sizes), self.assertRaises(ValueError):
+                generate.generate(**options, end=timezone.now(), workers=1,
+                                  rebuild=False)
+        self.assertFalse(User.objects.exists())
+
+
+class TestBulkFollow(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="newbie")
+        self.authors = [User.objects.create_user(username=f"author{number}")
+                        for number in range(4)]
+        for author in self.authors:
+            Post.objects.create(text=f"пост {author.username}", author=author)
+        self.client.force_login(self.user)
+        self.url = reverse("api_follow_bulk")
+
+    def post(self, **data):
+        return self.client.post(self.url, json.dumps(data),
+                                content_type="application/json")
+
+    def test_follow_many_in_one_request(self):
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        names = [author.username for author in self.authors] + ["newbie"]
+        response = self.post(follow=names)
+        self.assertEqual(response.json()["followed"],
+                         ["author1", "author2", "author3"])
+        self.assertEqual(Follow.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(self.user.feed.count(), 4)
+        self.assertEqual(UserStats.objects.get(user=self.user).
+                         following_count, 4)
+        self.assertEqual(UserStats.objects.get(user=self.authors[3]).
+                         followers_count, 1)
+        self.assertEqual(self.post(follow=names).json()["followed"], [])
+
+    def test_unknown_author_rejects_whole_request(self):
+        response = self.post(follow=["author1"], unfollow=["ghost"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["usernames"], ["ghost"])
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.post(follow="author1").status_code, 400)
+        with self.settings(FOLLOW_BULK_LIMIT=2):
+            response = self.post(follow=["author1", "author2", "author3"])
+        self.assertEqual(response.status_code, 400)
+
+    def test_unfollow_many(self):
+        self.post(follow=["author1", "author2"])
+        response = self.post(unfollow=["author1", "author3"])
+        self.assertEqual(response.json()["unfollowed"], ["author1"])
+        self.assertEqual(self.user.feed.count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.user).
+                         following_count, 1)
+
+    def test_requires_login_and_post(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        self.assertEqual(self.post(follow=["author1"]).status_code, 401)
+
+    def test_unfollow_unknown_user_is_404(self):
+        response = self.client.get(reverse("profile_unfollow",
+                                           args=["ghost"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestFollowSuggestions(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.users = {name: User.objects.create_user(username=name)
+                      for name in ("ann", "bob", "cat", "dan", "eve", "fay")}
+        for user, author in [("ann", "bob"), ("ann", "cat"), ("bob", "dan"),
+                             ("cat", "dan"), ("cat", "eve"), ("bob", "ann"),
+                             ("eve", "fay"), ("dan", "fay"), ("bob", "fay")]:
+            Follow.objects.create(user=self.users[user],
+                                  author=self.users[author])
+
+    def names(self, user):
+        return [(suggestion.author.username, suggestion.score)
+                for suggestion in suggestions.for_user(user)]
+
+    def test_friends_of_friends_ranked_by_mutuals(self):
+        with self.settings(SUGGESTIONS_PER_USER=3):
+            call_command("compute_suggestions", stdout=io.StringIO())
+            self.assertEqual(self.names(self.users["ann"]),
+                             [("dan", 2), ("eve", 1), ("fay", 1)])
+            # Новичку без подписок достаются популярные авторы
+            newbie = User.objects.create_user(username="newbie")
+            suggestions.compute()
+            self.assertEqual(self.names(newbie),
+                             [("ann", 0), ("dan", 0), ("fay", 0)])
+
+    def test_api_hides_followed_authors(self):
+        suggestions.compute()
+        ann = self.users["ann"]
+        url = reverse("api_follow_suggestions")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(ann)
+        response = self.client.get(url)
+        self.assertEqual(response.json()["results"][0]["username"], "dan")
+        etag = response["ETag"]
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Follow.objects.create(user=ann, author=self.users["dan"])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("dan", [row["username"]
+                                 for row in response.json()["results"]])
+
+
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="reader")
+        self.cats = Group.objects.create(title="Котики", slug="cats",
+                                         description="")
+        self.dogs = Group.objects.create(title="Собаки", slug="dogs",
+                                         description="")
+        self.quiet = Post.objects.create(text="тихий", author=self.author,
+                                         group=self.dogs)
+        self.loud = Post.objects.create(text="громкий", author=self.author,
+                                        group=self.cats)
+        for number in range(3):
+            Comment.objects.create(post=self.loud, author=self.reader,
+                                   text=f"ого {number}")
+
+    def test_recent_activity_ranks_first_and_decays(self):
+        now = timezone.now()
+        self.assertEqual(trending.compute(now), 5)
+        self.assertEqual(trending.top_posts(), [self.loud, self.quiet])
+        self.assertEqual(trending.top_groups(), [self.cats, self.dogs])
+        score = TrendingScore.objects.get(kind="post", object_id=self.loud.id)
+
+        # Повторный запуск не учитывает старые события дважды
+        later = now + dt.timedelta(
+            hours=settings.TRENDING_HALF_LIFE_HOURS)
+        self.assertEqual(trending.compute(later), 0)
+        self.assertAlmostEqual(
+            TrendingScore.objects.get(pk=score.pk).score, score.score / 2)
+
+        with mock.patch("django.utils.timezone.now",
+                        return_value=later):
+            for number in range(6):
+                Comment.objects.create(post=self.quiet, author=self.reader,
+                                       text=f"лай {number}")
+        trending.compute(later)
+        self.assertEqual(trending.top_posts()[0], self.quiet)
+
+        far = later + dt.timedelta(days=30)
+        trending.compute(far)
+        self.assertFalse(TrendingScore.objects.exists())
+
+    def test_page_is_served_from_cache(self):
+        trending.compute()
+        response = self.client.get(reverse("trending"))
+        self.assertContains(response, "громкий")
+        self.assertContains(response, "Котики")
+        with self.assertNumQueries(0):
+            self.client.get(reverse("trending"))
+        Comment.objects.create(post=self.quiet, author=self.reader,
+                               text="новый")
+        call_command("compute_trending", stdout=io.StringIO())
+        self.assertEqual(
+            self.client.get(reverse("trending")).status_code, 200)
+
+
+class TestCommentWriteBehind(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "comments.journal")
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="reader")
+        self.post = Post.objects.create(text="вирусный пост",
+                                        author=self.author)
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.writers = []
+
+    def tearDown(self):
+        for writer in self.writers:
+            writer.journal.close()
+        self.directory.cleanup()
+
+    def writer(self):
+        writer = comment_writer.CommentWriter(self.path, start=False)
+        self.writers.append(writer)
+        return writer
+
+    def comment(self, writer, text):
+        with mock.patch.object(comment_writer, "get_writer",
+                               return_value=writer):
+            return self.client.post(
+                reverse("add_comment", args=["writer", self.post.id]),
+                {"text": text})
+
+    def page(self, client):
+        with mock.patch.object(comment_writer, "get_writer",
+                               return_value=self.writers[-1]):
+            return client.get(reverse("post", args=["writer",
+                                                    self.post.id]))
+
+    def test_queued_comment_is_visible_to_its_author(self):
+        writer = self.writer()
+        self.page(self.client)
+        response = self.comment(writer, "Первый!")
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Comment.objects.exists())
+        self.assertContains(self.page(self.client), "Первый!")
+        self.assertNotContains(self.page(Client()), "Первый!")
+
+        writer.flush()
+        self.assertEqual(Comment.objects.get().text, "Первый!")
+        self.assertEqual(writer.pending_for(self.post.id, self.reader), [])
+        self.assertEqual(UserStats.objects.get(user=self.reader).
+                         comments_count, 1)
+        self.assertEqual(find("первый"), [self.post.id])
+        self.assertContains(self.page(Client()), "Первый!")
+        self.assertEqual(CommentJournal.objects.get(path=self.path).offset,
+                         os.path.getsize(self.path))
+
+    def test_journal_is_replayed_after_crash(self):
+        writer = self.writer()
+        for number in range(3):
+            self.comment(writer, f"комментарий {number}")
+        writer.flush()
+        self.comment(writer, "потерялся бы")
+        writer.journal.close()
+        with open(self.path, "ab") as journal:
+            journal.write(b'{"post_id": 1, "author')
+
+        with self.assertLogs("posts.comment_writer", "WARNING"):
+            self.writer()
+        self.assertEqual(
+            list(Comment.objects.order_by("id").values_list(
+                "text", flat=True)),
+            ["комментарий 0", "комментарий 1", "комментарий 2",
+             "потерялся бы"])
+        self.writers[-1].journal.close()
+        self.writer()
+        self.assertEqual(Comment.objects.count(), 4)
+
+    def test_full_queue_rejects_comment(self):
+        with self.settings(COMMENT_QUEUE_SIZE=1, COMMENT_QUEUE_TIMEOUT=0):
+            writer = self.writer()
+            self.assertEqual(self.comment(writer, "раз").status_code, 302)
+            response = self.comment(writer, "два")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        writer.flush()
+        self.assertEqual(self.comment(writer, "три").status_code, 302)
+
+    def test_queue_order_matches_journal_order(self):
+        writer = self.writer()
+        append = writer.journal.append
+        appended = threading.Event()
+
+        def slow_append(record):
+            offset = append(record)
+            if record["text"] == "первый":
+                appended.set()
+                # Окно, в котором второй поток мог бы обогнать первый
+                time.sleep(0.1)
+            return offset
+
+        def submit(text):
+            writer.submit(self.post.id, self.reader, text)
+
+        with mock.patch.object(writer.journal, "append", slow_append), \
+                mock.patch.object(comment_writer, "_bump_posts"):
+            first = threading.Thread(target=submit, args=["первый"])
+            first.start()
+            appended.wait(5)
+            second = threading.Thread(target=submit, args=["второй"])
+            second.start()
+            first.join()
+            second.join()
+        queued = list(writer.queue.queue)
+        self.assertEqual([record["text"] for record, _ in queued],
+                         ["первый", "второй"])
+        self.assertLess(queued[0][1], queued[1][1])
+        writer.flush()
+        self.assertEqual(CommentJournal.objects.get(path=self.path).offset,
+                         os.path.getsize(self.path))
+
+    def test_comment_of_deleted_author_is_skipped(self):
+        writer = self.writer()
+        ghost = User.objects.create_user(username="ghost")
+        writer.submit(self.post.id, ghost, "от призрака")
+        writer.submit(self.post.id, self.reader, "живой")
+        ghost.delete()
+        with self.assertLogs("posts.comment_writer", "WARNING"):
+            writer.flush()
+        self.assertEqual(list(Comment.objects.values_list("text", flat=True)),
+                         ["живой"])
+        self.assertEqual(CommentJournal.objects.get(path=self.path).offset,
+                         os.path.getsize(self.path))
+
+    def test_failing_row_does_not_block_queue(self):
+        with self.settings(COMMENT_QUEUE_SIZE=2):
+            writer = self.writer()
+            for text in ("хороший", "плохой"):
+                writer.submit(self.post.id, self.reader, text)
+        write = writer._write
+
+        def broken_write(batch):
+            if any(record["text"] == "плохой" for record, _ in batch):
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return write(batch)
+
+        with mock.patch.object(writer, "_write", broken_write), \
+                mock.patch.object(comment_writer, "RETRY_SECONDS", 0), \
+                self.assertLogs("posts.comment_writer", "ERROR"):
+            writer.flush()
+        self.assertEqual(list(Comment.objects.values_list("text", flat=True)),
+                         ["хороший"])
+        self.assertEqual(CommentJournal.objects.get(path=self.path).offset,
+                         os.path.getsize(self.path))
+        # Места в очереди освобождены и для пропущенной строки
+        writer.submit(self.post.id, self.reader, "ещё")
+        writer.submit(self.post.id, self.reader, "и ещё")
+
+    def test_replay_skips_rows_that_cannot_be_written(self):
+        with open(self.path, "w") as journal:
+            journal.write(json.dumps({"post_id": self.post.id,
+                                      "author_id": 10 ** 6,
+                                      "text": "сирота"}) + "\n")
+        with self.assertLogs("posts.comment_writer", "WARNING"):
+            self.writer()
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(CommentJournal.objects.get(path=self.path).offset,
+                         os.path.getsize(self.path))
+
+    def test_journal_has_single_owner(self):
+        self.writer()
+        with self.assertRaises(OSError):
+            comment_writer.CommentWriter(self.path, start=False)
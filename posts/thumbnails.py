@@ -0,0 +1,107 @@
+"""
+Фоновая генерация миниатюр картинок постов.
+
+Миниатюра sorl-thumbnail и адаптивные варианты картинки (posts/images.py)
+строятся в пуле потоков после сохранения поста, а не во время первого
+рендера ленты. Пока миниатюра не готова, шаблон
+показывает заглушку. Готовность хранится в базе: непустой
+Post.image_variants записывается после миниатюры. URL миниатюры
+кэшируется под именем файла картинки; после очистки кэша или в другом
+воркере он берётся из kvstore sorl без перестроения и без повторной
+записи поста. Когда миниатюра готова, версия поста обновляется, и
+карточки (их ключ включает варианты) и страницы с ним перестраиваются.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from sorl.thumbnail import get_thumbnail
+
+from yatube import metrics
+
+from . import images
+from .cache import bump, post_id_scopes
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = "960x339"
+OPTIONS = {"crop": "center", "upscale": True}
+PENDING_TIMEOUT = 60
+
+_executor = None
+
+
+def _ready_key(image_name):
+    return f"thumb:{image_name}"
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails",
+        )
+    return _executor
+
+
+def thumbnail_url(post):
+    """URL готовой миниатюры поста или None, если она ещё строится."""
+    url = cache.get(_ready_key(post.image.name))
+    metrics.record_cache(hits=url is not None, misses=url is None)
+    if url is None and post.image_variants:
+        # Миниатюра уже на диске и в kvstore: get_thumbnail её не строит
+        url = generate(post.image.name)
+    return url
+
+
+def generate(image_name):
+    """Строит миниатюру синхронно и отмечает её готовность."""
+    thumbnail = get_thumbnail(image_name, GEOMETRY, **OPTIONS)
+    cache.set(_ready_key(image_name), thumbnail.url, None)
+    return thumbnail.url
+
+
+def process(post_id, image_name):
+    """Строит миниатюру и варианты картинки поста; True при успехе."""
+    try:
+        with metrics.timed("thumbnail"):
+            generate(image_name)
+            variants = images.build_variants(image_name)
+        # updated не трогаем: это время правки поста автором, его
+        # отдаёт API
+        Post.objects.filter(pk=post_id, image=image_name).update(
+            image_variants=variants)
+        bump(*post_id_scopes(post_id))
+        return True
+    except Exception:
+        logger.exception("Не удалось построить миниатюру %s", image_name)
+        return False
+    finally:
+        cache.delete(f"thumb-pending:{image_name}")
+
+
+def process_in_thread(post_id, image_name):
+    try:
+        return process(post_id, image_name)
+    finally:
+        connection.close()
+
+
+def enqueue(post):
+    """Ставит построение миниатюры в очередь после коммита транзакции."""
+    if not post.image:
+        return
+    image_name = post.image.name
+    if not cache.add(f"thumb-pending:{image_name}", 1, PENDING_TIMEOUT):
+        return
+    if settings.THUMBNAIL_WORKERS == 0:
+        transaction.on_commit(lambda: process(post.pk, image_name))
+    else:
+        transaction.on_commit(
+            lambda: _get_executor().submit(
+                process_in_thread, post.pk, image_name)
+        )
@@ -0,0 +1,232 @@
+"""
+Потоковые выгрузка и загрузка данных в NDJSON.
+
+Каждая строка — один объект: {"model": ..., "pk": ..., "fields": {...}}.
+Модели идут в порядке зависимостей (пользователи, группы, посты,
+комментарии, подписки), поэтому загрузка проходит файл один раз и держит
+в памяти только текущую пачку строк.
+
+Пользователи и группы сопоставляются по username и slug, посты и
+комментарии получают id исходной базы плюс сдвиг, равный максимальному id
+в базе на момент первого запуска. Все вставки идут через bulk_create с
+ignore_conflicts, поэтому повтор уже загруженной пачки ничего не меняет.
+После каждой пачки номер строки и сдвиги сохраняются в файл контрольной
+точки, и прерванная загрузка продолжается с него.
+
+Сигналы при загрузке не срабатывают: ленты, счётчики профилей, поисковый
+индекс и кэш страниц пересобираются в конце. Файлы картинок не
+переносятся, только их имена.
+"""
+import datetime
+import json
+import os
+from itertools import groupby
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from . import feed, search, stats
+from .bulk import batched, preserve_dates
+from .models import Comment, Follow, Group, Post, User
+
+CHUNK_SIZE = 5000
+
+# Метка, модель и выгружаемые поля; ссылки на пользователей и группы
+# выгружаются естественными ключами (username, slug)
+MODELS = [
+    ("auth.user", User, ["username", "password", "email", "first_name",
+                         "last_name", "is_active", "is_staff",
+                         "is_superuser", "date_joined", "last_login"]),
+    ("posts.group", Group, ["title", "slug", "description"]),
+    ("posts.post", Post, ["text", "pub_date", "updated", "author__username",
+                          "group__slug", "image", "image_variants"]),
+    ("posts.comment", Comment, ["post_id", "author__username", "text",
+                                "created"]),
+    ("posts.follow", Follow, ["user__username", "author__username"]),
+]
+DATE_FIELDS = {"date_joined", "last_login", "pub_date", "updated", "created"}
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"{value!r} не сериализуется в JSON")
+
+
+def dump(stream, chunk_size=CHUNK_SIZE):
+    """Пишет все объекты в stream; возвращает число строк."""
+    total = 0
+    for label, model, fields in MODELS:
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by("pk").
+                        values_list("pk", *fields)[:chunk_size])
+            if not rows:
+                break
+            stream.writelines(
+                json.dumps({"model": label, "pk": row[0],
+                            "fields": dict(zip(fields, row[1:]))},
+                           ensure_ascii=False, default=_default) + "\n"
+                for row in rows
+            )
+            total += len(rows)
+            last_pk = rows[-1][0]
+    return total
+
+
+class Checkpoint:
+    """Номер последней загруженной строки и сдвиги id в JSON-файле."""
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as source:
+                self.state = json.load(source)
+
+    @property
+    def line(self):
+        return self.state.get("line", 0)
+
+    def offset(self, model):
+        """Сдвиг id модели; при первом запуске — максимальный id в базе."""
+        key = f"{model._meta.model_name}_offset"
+        if key not in self.state:
+            self.state[key] = model.objects.aggregate(
+                top=Max("pk"))["top"] or 0
+        return self.state[key]
+
+    def save(self, line):
+        self.state["line"] = line
+        if not self.path:
+            return
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as target:
+            json.dump(self.state, target)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _dates(fields):
+    for name in DATE_FIELDS & fields.keys():
+        if fields[name]:
+            fields[name] = parse_datetime(fields[name])
+    return fields
+
+
+def _ids(model, field, values):
+    """Словарь естественный ключ -> id для пачки значений."""
+    values = {value for value in values if value is not None}
+    return dict(model.objects.filter(**{f"{field}__in": values}).
+                values_list(field, "pk")) if values else {}
+
+
+def _load_users(records):
+    User.objects.bulk_create(
+        [User(**_dates(record["fields"])) for record in records],
+        ignore_conflicts=True,
+    )
+
+
+def _load_groups(records):
+    Group.objects.bulk_create(
+        [Group(**record["fields"]) for record in records],
+        ignore_conflicts=True,
+    )
+
+
+def _load_posts(records, checkpoint):
+    offset = checkpoint.offset(Post)
+    fields = [_dates(record["fields"]) for record in records]
+    users = _ids(User, "username", (f["author__username"] for f in fields))
+    groups = _ids(Group, "slug", (f["group__slug"] for f in fields))
+    Post.objects.bulk_create([
+        Post(id=record["pk"] + offset, text=f["text"],
+             pub_date=f["pub_date"], updated=f["updated"] or f["pub_date"],
+             author_id=users[f["author__username"]],
+             group_id=groups.get(f["group__slug"]),
+             image=f["image"], image_variants=f["image_variants"])
+        for record, f in zip(records, fields)
+    ], ignore_conflicts=True)
+
+
+def _load_comments(records, checkpoint):
+    post_offset = checkpoint.offset(Post)
+    offset = checkpoint.offset(Comment)
+    fields = [_dates(record["fields"]) for record in records]
+    users = _ids(User, "username", (f["author__username"] for f in fields))
+    Comment.objects.bulk_create([
+        Comment(id=record["pk"] + offset, post_id=f["post_id"] + post_offset,
+                author_id=users[f["author__username"]], text=f["text"],
+                created=f["created"])
+        for record, f in zip(records, fields)
+    ], ignore_conflicts=True)
+
+
+def _load_follows(records):
+    fields = [record["fields"] for record in records]
+    users = _ids(User, "username", (name for f in fields for name in
+                                    (f["user__username"],
+                                     f["author__username"])))
+    Follow.objects.bulk_create([
+        Follow(user_id=users[f["user__username"]],
+               author_id=users[f["author__username"]])
+        for f in fields
+    ], ignore_conflicts=True)
+
+
+def _load_chunk(records, checkpoint):
+    for label, group in groupby(records, key=lambda record: record["model"]):
+        group = list(group)
+        if label == "auth.user":
+            _load_users(group)
+        elif label == "posts.group":
+            _load_groups(group)
+        elif label == "posts.post":
+            _load_posts(group, checkpoint)
+        elif label == "posts.comment":
+            _load_comments(group, checkpoint)
+        elif label == "posts.follow":
+            _load_follows(group)
+        else:
+            raise ValueError(f"Неизвестная модель {label}")
+
+
+def load(stream, checkpoint_path=None, chunk_size=CHUNK_SIZE, rebuild=True,
+         stdout=None):
+    """
+    Загружает объекты из stream пачками по chunk_size строк, каждую в своей
+    транзакции; возвращает число загруженных строк.
+    """
+    checkpoint = Checkpoint(checkpoint_path)
+    skip = checkpoint.line
+    # Сдвиги фиксируются до первой вставки, иначе после сбоя они
+    # посчитались бы заново уже с учётом загруженных строк
+    checkpoint.offset(Post)
+    checkpoint.offset(Comment)
+    checkpoint.save(skip)
+    line = 0
+    with preserve_dates(Post, Comment):
+        for chunk in batched(stream, chunk_size):
+            line += len(chunk)
+            if line <= skip:
+                continue
+            records = [json.loads(text) for text in chunk[-(line - skip):]
+                       if text.strip()]
+            with transaction.atomic():
+                _load_chunk(records, checkpoint)
+            checkpoint.save(line)
+            if stdout is not None:
+                stdout.write(f"Загружено строк: {line}")
+    if rebuild:
+        feed.rebuild()
+        stats.reconcile()
+        search.rebuild()
+        cache.clear()
+    checkpoint.clear()
+    return line - skip
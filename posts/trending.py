@@ -0,0 +1,123 @@
+"""
+Популярное: посты и группы с самой свежей активностью.
+
+Каждое событие — новый комментарий к посту или новый пост — добавляет
+посту и его группе вес, который затухает вдвое за
+TRENDING_HALF_LIFE_HOURS. Вес нового поста растёт с логарифмом числа
+подписчиков автора: у Follow нет даты, поэтому свежие подписки как
+события не видны, и подписчики учитываются как охват поста.
+
+compute считает рейтинг инкрементально. Сначала он умножает все строки
+TrendingScore на коэффициент затухания за время с прошлого запуска
+(одним UPDATE). Затем добавляет вес комментариев и постов, появившихся
+после прошлого запуска, с затуханием по их Comment.created и
+Post.pub_date, и удаляет строки, затухшие ниже TRENDING_MIN_SCORE.
+Таблица остаётся маленькой: в ней только недавно активные посты и
+группы. После пересчёта сбрасывается версия области кэша trending, а
+страница читает готовый рейтинг из кэша страниц.
+"""
+import datetime as dt
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .bulk import batched
+from .cache import bump_on_commit
+from .models import Comment, Group, Post, TrendingRun, TrendingScore
+
+POST, GROUP = "post", "group"
+
+
+def _decay(seconds):
+    return 0.5 ** (seconds / (settings.TRENDING_HALF_LIFE_HOURS * 3600))
+
+
+def _events(last, run, start):
+    """(пост, группа, вес, дата) событий после last и не позже run."""
+    comments = Comment.objects.filter(id__lte=run.last_comment_id).\
+        values_list("post_id", "post__group_id", "created")
+    posts = Post.objects.filter(id__lte=run.last_post_id).values_list(
+        "id", "group_id", "author__stats__followers_count", "pub_date")
+    if last is None:
+        comments = comments.filter(created__gt=start)
+        posts = posts.filter(pub_date__gt=start)
+    else:
+        comments = comments.filter(id__gt=last.last_comment_id)
+        posts = posts.filter(id__gt=last.last_post_id)
+    for post_id, group_id, created in comments.iterator():
+        yield post_id, group_id, 1.0, created
+    for post_id, group_id, followers, pub_date in posts.iterator():
+        yield post_id, group_id, 1 + math.log1p(followers or 0), pub_date
+
+
+def compute(now=None):
+    """Обновляет рейтинг; возвращает число учтённых событий."""
+    now = now or timezone.now()
+    last = TrendingRun.objects.first()
+    # Граница по id, а не по дате: строка, закоммиченная позже с более
+    # ранней датой, не потеряется. Без прошлого запуска берём события за
+    # десять периодов полураспада — более старые весят меньше 0.1%.
+    start = now - dt.timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS * 10)
+    run = TrendingRun(
+        computed=now,
+        last_comment_id=Comment.objects.aggregate(top=Max("id"))["top"] or 0,
+        last_post_id=Post.objects.aggregate(top=Max("id"))["top"] or 0,
+    )
+    gains = Counter()
+    events = 0
+    for post_id, group_id, weight, date in _events(last, run, start):
+        weight *= _decay(max(0, (now - date).total_seconds()))
+        gains[POST, post_id] += weight
+        if group_id:
+            gains[GROUP, group_id] += weight
+        events += 1
+    with transaction.atomic():
+        if last is not None:
+            TrendingScore.objects.update(score=F("score") * _decay(
+                max(0, (now - last.computed).total_seconds())))
+        _add(gains)
+        TrendingScore.objects.filter(
+            score__lt=settings.TRENDING_MIN_SCORE).delete()
+        TrendingRun.objects.all().delete()
+        run.save()
+        bump_on_commit("trending")
+    return events
+
+
+def _add(gains):
+    for kind in (POST, GROUP):
+        ids = [object_id for key, object_id in gains if key == kind]
+        for batch in batched(ids, 500):
+            existing = {row.object_id: row for row in TrendingScore.objects.
+                        filter(kind=kind, object_id__in=batch)}
+            for row in existing.values():
+                row.score += gains[kind, row.object_id]
+            TrendingScore.objects.bulk_update(existing.values(), ["score"])
+            TrendingScore.objects.bulk_create(
+                TrendingScore(kind=kind, object_id=object_id,
+                              score=gains[kind, object_id])
+                for object_id in batch if object_id not in existing)
+
+
+def top(kind, limit=None):
+    """id самых популярных объектов kind по убыванию веса."""
+    return list(TrendingScore.objects.filter(kind=kind).
+                order_by("-score", "object_id").
+                values_list("object_id", flat=True)[
+                    :limit or settings.TRENDING_SIZE])
+
+
+def top_posts(limit=None):
+    ids = top(POST, limit)
+    posts = Post.objects.for_feed().in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def top_groups(limit=None):
+    ids = top(GROUP, limit)
+    groups = Group.objects.in_bulk(ids)
+    return [groups[pk] for pk in ids if pk in groups]
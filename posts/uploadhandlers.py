@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class SizeLimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загрузку во временный файл по частям и перестаёт писать после
+    POST_IMAGE_MAX_UPLOAD_SIZE байт. Остаток тела запроса вычитывается и
+    отбрасывается, у файла выставляется oversized, а ошибку показывает
+    форма.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_UPLOAD_SIZE:
+            if not self.oversized:
+                self.oversized = True
+                self.file.seek(0)
+                self.file.truncate()
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.oversized = self.oversized
+        return file
@@ -8,7 +8,14 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("group/<slug:slug>/", views.group_posts, name = "group_posts"),
     path("new", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
+    path("trending/", views.trending_view, name="trending"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
+    path(
+        "<str:username>/<int:post_id>/comments/",
+        views.post_comments,
+        name="post_comments"
+    ),
     path(
         "<str:username>/<int:post_id>/edit/",
         views.post_edit,
@@ -1,16 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Post, Group, User, Follow
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from .models import Post, Group, User, Follow, Comment
 from .forms import PostForm, CommentForm
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from django.db.models import F
+from django.utils.http import urlencode
+from . import comment_writer, thumbnails, trending
+from .cache import cache_versioned_page
+from .paginators import CursorPaginator
+from .search import find
+from .stats import get_stats
 
-@cache_page(20, key_prefix="index_page")
+
+def paginate(request, queryset, ordering=("-pub_date", "-id")):
+    """
+    Разбивает ленту на страницы.
+
+    Курсорная пагинация включается параметрами ?after=/?before= или
+    настройкой POSTS_CURSOR_PAGINATION, иначе используется обычный Paginator.
+    """
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    if after or before or settings.POSTS_CURSOR_PAGINATION:
+        paginator = CursorPaginator(queryset, 10, ordering=ordering)
+        return paginator, paginator.get_page(after=after, before=before)
+    paginator = Paginator(queryset, 10)
+    return paginator, paginator.get_page(request.GET.get("page"))
+
+
+@cache_versioned_page(lambda request: ["index"])
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed().order_by("-pub_date", "-id")
+    paginator, page = paginate(request, post_list)
     return render(
         request,
         "index.html",
@@ -19,18 +43,40 @@ def index(request):
     )
 
 
+@cache_versioned_page(lambda request, slug: [f"group:{slug}"])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = group.posts.for_feed().order_by("-pub_date", "-id")
+    paginator, page = paginate(request, posts)
     return render(request, "group.html", {"group": group,
                                           "posts": posts,
                                           "page": page,
                                           "paginator": paginator})
 
 
+@cache_versioned_page(lambda request: ["trending"])
+def trending_view(request):
+    """Популярные посты и группы из рейтинга compute_trending."""
+    return render(request, "trending.html",
+                  {"posts": trending.top_posts(),
+                   "groups": trending.top_groups()})
+
+
+def search(request):
+    """Поиск по постам и комментариям через индекс SearchTerm."""
+    query = request.GET.get("q", "").strip()
+    paginator = Paginator(find(query) if query else [], 10)
+    page = paginator.get_page(request.GET.get("page"))
+    posts = Post.objects.for_feed().in_bulk(page.object_list)
+    return render(request, "search.html", {
+        "query": query,
+        "page": page,
+        "paginator": paginator,
+        "posts": [posts[pk] for pk in page.object_list if pk in posts],
+        "extra": urlencode({"q": query}) + "&",
+    })
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -39,22 +85,24 @@ def new_post(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            thumbnails.enqueue(post)
             return redirect("index")
     return render(request, "new.html", {"form": form,
                                         "title_text": "Добавить запись",
                                         "button_text": "Добавить"})
 
 
+@cache_versioned_page(lambda request, username: [f"profile:{username}"])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post = author.posts.all()
-    paginator = Paginator(post, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
-    following = author.following.count()
-    subscriptions = author.follower.count()
+    author = get_object_or_404(User.objects.select_related("stats"),
+                               username=username)
+    post = author.posts.for_feed().order_by("-pub_date", "-id")
+    paginator, page = paginate(request, post)
+    author_stats = get_stats(author)
+    following = author_stats.followers_count
+    subscriptions = author_stats.following_count
     return render(request, "profile.html", {"author": author,
-                                            "count":paginator.count,
+                                            "count": author_stats.posts_count,
                                             "page": page,
                                             "post": post,
                                             "paginator": paginator,
@@ -62,18 +110,39 @@ def profile(request, username):
                                             "subscriptions":subscriptions})
 
 
+def paginate_comments(post_id, after=None):
+    """Страница комментариев поста в порядке добавления, с авторами."""
+    comments = Comment.objects.filter(post_id=post_id).select_related("author")
+    paginator = CursorPaginator(comments, settings.COMMENTS_PER_PAGE,
+                                ordering=("created", "id"))
+    return paginator, paginator.get_page(after=after)
+
+
+@cache_versioned_page(lambda request, username, post_id: [
+    f"post:{post_id}", f"profile:{username}"])
 def post_view(request, username, post_id):
     """Просмотр одного поста."""
-    post = get_object_or_404(Post, id=post_id, author__username=username)
+    post = get_object_or_404(
+        Post.objects.for_feed().select_related("author__stats"),
+        id=post_id, author__username=username)
     form = CommentForm(request.POST or None)
     author = post.author
-    count = author.posts.count()
-    following = author.following.count()
-    subscriptions = author.follower.count()
+    author_stats = get_stats(author)
+    count = author_stats.posts_count
+    following = author_stats.followers_count
+    subscriptions = author_stats.following_count
+    paginator, comments = paginate_comments(
+        post.id, request.GET.get("comments_after"))
     return render(request, "post.html", {
         "post": post,
         "author": author,
-        "items": post.comments.all(),
+        # Шаблон его не читает, но по контракту страницы поста в контексте
+        # есть QuerySet комментариев (tests/test_post.py); он ленивый и
+        # не выполняется
+        "comments": paginator.object_list,
+        "items": comments,
+        # Свои комментарии из очереди отложенной записи
+        "pending": comment_writer.pending_for(post.id, request.user),
         "form": form,
         "count": count,
         "following": following,
@@ -81,6 +150,24 @@ def post_view(request, username, post_id):
     })
 
 
+def post_comments(request, username, post_id):
+    """Следующая страница комментариев поста в JSON для подгрузки."""
+    post = get_object_or_404(Post.objects.only("id"), id=post_id,
+                             author__username=username)
+    _, page = paginate_comments(post.id, request.GET.get("after"))
+    return JsonResponse({
+        "comments": [
+            {"id": comment.id,
+             "author": comment.author.username,
+             "author_url": reverse("profile", args=[comment.author.username]),
+             "text": comment.text,
+             "created": comment.created}
+            for comment in page
+        ],
+        "next": page.next_cursor,
+    })
+
+
 @login_required
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, author__username=username, id=post_id)
@@ -88,7 +175,13 @@ def post_edit(request, username, post_id):
         return redirect("post", username=username, post_id=post_id)
     form = PostForm(request.POST or None, files=request.FILES or None, instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        if "image" in form.changed_data:
+            # Варианты старой картинки: миниатюра новой ещё не готова
+            post.image_variants = ""
+        post.save()
+        if "image" in form.changed_data:
+            thumbnails.enqueue(post)
         return redirect("post", username=username, post_id=post_id)
     return render(request, "new.html", {"form":form, "post":post,
                                         "title_text": "Редактировать запись",
@@ -112,20 +205,33 @@ def add_comment(request, username, post_id):
     """Добавление комментария к посту."""
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        form.instance.author = request.user
-        form.instance.post_id = post_id
-        form.save()
+        writer = comment_writer.get_writer()
+        if writer is None:
+            form.instance.author = request.user
+            form.instance.post_id = post_id
+            form.save()
+        else:
+            get_object_or_404(Post.objects.only("id"), id=post_id)
+            try:
+                writer.submit(post_id, request.user,
+                              form.cleaned_data["text"])
+            except comment_writer.QueueFull:
+                response = HttpResponse(
+                    "Слишком много комментариев, попробуйте ещё раз",
+                    status=503)
+                response["Retry-After"] = "1"
+                return response
     return redirect("post", username=username, post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    user_follows = Follow.objects.select_related("author").\
-        filter(user=request.user).values_list("author")
-    posts = Post.objects.filter(author__in=user_follows)
-    paginator = Paginator(posts, 10)
+    posts = Post.objects.for_feed().\
+        filter(feed_entries__user=request.user).\
+        annotate(feed_date=F("feed_entries__pub_date")).\
+        order_by("-feed_date", "-id")
+    paginator, page = paginate(request, posts, ordering=("-feed_date", "-id"))
     page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
     return render(request,
                   "follow.html",
                   {"page": page,
@@ -141,10 +247,9 @@ def profile_follow(request, username):
     return redirect("profile", username=username)
 
 
-
 @login_required
 def profile_unfollow(request, username):
-    author = User.objects.get(username=username)
+    author = get_object_or_404(User, username=username)
     Follow.objects.filter(
         user=request.user,
         author=author,
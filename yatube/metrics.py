@@ -0,0 +1,231 @@
+"""
+Метрики запросов.
+
+MetricsMiddleware считает для каждого запроса число SQL-запросов и их
+время (execute_wrapper на всех соединениях), время рендера шаблонов
+(бэкенд TimedTemplates), попадания и промахи кэшей страниц, карточек и
+миниатюр (record_cache) и время построения миниатюр (timed). Итог уходит
+в гистограммы по имени URL, которые отдаёт metrics_view в текстовом
+формате Prometheus, а при METRICS_SERVER_TIMING — и в заголовок
+Server-Timing. Заголовок раскрывает устройство сайта каждому клиенту,
+поэтому по умолчанию выключен; его включает нагрузочный тест bench_urls.
+
+На запрос приходится несколько вызовов perf_counter и одно обновление
+гистограммы под блокировкой, так что middleware можно держать включённым
+на всём трафике. Гистограммы свои в каждом процессе сервера (как у
+prometheus_client без multiprocess-режима), в выводе есть pid.
+"""
+import hmac
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+# Границы корзин гистограммы времени ответа, в секундах
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Счётчики запроса: имя и единица в выводе Prometheus
+COUNTERS = (("queries", ""), ("sql", "_seconds"), ("template", "_seconds"),
+            ("thumbnail", "_seconds"), ("cache_hits", ""),
+            ("cache_misses", ""))
+
+_state = threading.local()
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса."""
+    return getattr(_state, "metrics", None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.totals = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.totals["queries"] += 1
+            self.totals["sql"] += time.perf_counter() - started
+
+    def server_timing(self, seconds):
+        totals = self.totals
+        parts = [
+            f'db;dur={totals["sql"] * 1000:.1f};'
+            f'desc="{totals["queries"]} queries"',
+            f'cache;desc="hit {totals["cache_hits"]} '
+            f'miss {totals["cache_misses"]}"',
+        ]
+        parts += [f"{label};dur={totals[name] * 1000:.1f}"
+                  for name, label in (("template", "tpl"),
+                                      ("thumbnail", "thumb"))
+                  if totals[name]]
+        parts.append(f"total;dur={seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def record_cache(hits=0, misses=0):
+    metrics = current()
+    if metrics is not None:
+        metrics.totals["cache_hits"] += hits
+        metrics.totals["cache_misses"] += misses
+
+
+@contextmanager
+def timed(name):
+    """
+    Добавляет время блока к счётчику name текущего запроса; вложенные
+    блоки с тем же именем не считаются дважды. Вне запроса (фоновые
+    потоки) время попадает в гистограмму background:<name>.
+    """
+    active = _state.__dict__.setdefault("active", set())
+    if name in active:
+        yield
+        return
+    metrics = current()
+    active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        active.discard(name)
+        if metrics is None:
+            registry.observe(f"background:{name}", elapsed, {})
+        else:
+            metrics.totals[name] += elapsed
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.totals = Counter()
+
+
+class Registry:
+    """Гистограммы времени ответа и суммы счётчиков по имени URL."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, seconds, totals):
+        with self.lock:
+            histogram = self.views.get(view)
+            if histogram is None:
+                histogram = self.views[view] = Histogram()
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram.buckets[index] += 1
+                    break
+            histogram.count += 1
+            histogram.sum += seconds
+            histogram.totals.update(totals)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        """Текстовый формат Prometheus."""
+        with self.lock:
+            views = sorted(
+                (view, list(h.buckets), h.count, h.sum, Counter(h.totals))
+                for view, h in self.views.items()
+            )
+        pid = os.getpid()
+        metric = "yatube_request_duration_seconds"
+        lines = [f"# TYPE {metric} histogram"]
+        for view, buckets, count, total, _ in views:
+            label = f'view="{view}",pid="{pid}"'
+            cumulative = 0
+            for bound, number in zip(BUCKETS, buckets):
+                cumulative += number
+                lines.append(
+                    f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines += [
+                f'{metric}_bucket{{{label},le="+Inf"}} {count}',
+                f"{metric}_sum{{{label}}} {total:.6f}",
+                f"{metric}_count{{{label}}} {count}",
+            ]
+        for name, unit in COUNTERS:
+            metric = f"yatube_{name}{unit}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [
+                f'{metric}{{view="{view}",pid="{pid}"}} {totals[name]:g}'
+                for view, _, _, _, totals in views
+                if not view.startswith("background:")
+            ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _state.metrics = RequestMetrics()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            _state.metrics = None
+        seconds = time.perf_counter() - started
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "<unresolved>"
+        registry.observe(view, seconds, metrics.totals)
+        if settings.METRICS_SERVER_TIMING:
+            response["Server-Timing"] = metrics.server_timing(seconds)
+        return response
+
+
+def _has_token(request):
+    token = settings.METRICS_TOKEN
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    return bool(token) and hmac.compare_digest(header, f"Bearer {token}")
+
+
+def metrics_view(request):
+    """
+    Гистограммы процесса; доступны персоналу и сборщику с заголовком
+    Authorization: Bearer METRICS_TOKEN.
+    """
+    if not (_has_token(request) or request.user.is_staff):
+        raise Http404
+    return HttpResponse(registry.render(),
+                        content_type="text/plain; version=0.0.4")
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed("template"):
+            return super().render(context, request)
+
+
+class TimedTemplates(DjangoTemplates):
+    """Шаблоны Django с учётом времени рендера в метриках запроса."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
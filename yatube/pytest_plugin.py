@@ -0,0 +1,21 @@
+"""
+Бюджет запросов в pytest.
+
+    @pytest.mark.query_budget(max_queries=5, max_repeats=1)
+    def test_index(client): ...
+
+Проверяется только сам вызов теста, запросы фикстур не считаются.
+"""
+import pytest
+
+from yatube.querylog import query_budget
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        yield
+        return
+    with query_budget(*marker.args, **marker.kwargs):
+        yield
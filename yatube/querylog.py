@@ -0,0 +1,160 @@
+"""
+Журнал медленных запросов и поиск N+1.
+
+QueryInspector подключается к соединениям через execute_wrapper и
+сводит каждый запрос к «отпечатку»: SQL с параметрами %s, в котором
+списки IN (%s, %s, ...) и числа заменены заглушками. Запросы с одним
+отпечатком, повторённые в одном запросе к сайту хотя бы
+QUERY_REPEAT_THRESHOLD раз, — признак N+1 (например, обращение к связанной
+модели в цикле шаблона). Для них и для запросов дольше SLOW_QUERY_MS
+запоминается место в коде: первый кадр стека из приложений проекта и
+шаблон, при рендере которого выполнен запрос.
+
+QueryInspectorMiddleware пишет найденное в лог yatube.queries, а
+query_budget ограничивает число запросов в тестах (в pytest — маркер
+query_budget, см. yatube/pytest_plugin.py).
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Template
+
+logger = logging.getLogger("yatube.queries")
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_SPACE = re.compile(r"\s+")
+# Служебные модули проекта (middleware, роутеры) не считаются местом запроса
+_INFRASTRUCTURE = os.path.dirname(os.path.abspath(__file__))
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACE.sub(" ", _NUMBER.sub("?", sql)).strip()
+
+
+def origin():
+    """
+    Место запроса в коде проекта: «путь:строка», а если запрос выполнен
+    при рендере шаблона — ещё и имя ближайшего шаблона.
+    """
+    base = str(settings.BASE_DIR)
+    template = location = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        if template is None and code.co_name == "render":
+            owner = frame.f_locals.get("self")
+            if isinstance(owner, Template) and owner.origin:
+                template = owner.origin.template_name
+        filename = code.co_filename
+        if (filename.startswith(base) and "site-packages" not in filename
+                and not filename.startswith(_INFRASTRUCTURE)):
+            location = "%s:%s" % (os.path.relpath(filename, base),
+                                  frame.f_lineno)
+            break
+        frame = frame.f_back
+    location = location or "?"
+    return f"{location} ({template})" if template else location
+
+
+class QueryInspector:
+    def __init__(self, repeat_threshold=None, slow_ms=None):
+        self.repeat_threshold = repeat_threshold
+        self.slow_ms = slow_ms
+        self.count = 0
+        self.counts = Counter()
+        self.origins = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            key = fingerprint(sql)
+            self.count += 1
+            self.counts[key] += 1
+            # Стек разбирается только у повторов, один раз на отпечаток
+            if self.counts[key] == 2:
+                self.origins[key] = origin()
+            if self.slow_ms is not None and elapsed >= self.slow_ms:
+                logger.warning("Медленный запрос %.1f мс из %s: %s",
+                               elapsed, origin(), sql)
+
+    def repeated(self, threshold=None):
+        """[(отпечаток, число, место)] повторённых не меньше threshold раз."""
+        threshold = threshold or self.repeat_threshold
+        return [(key, count, self.origins.get(key, "?"))
+                for key, count in self.counts.most_common()
+                if threshold and count >= threshold]
+
+    @contextmanager
+    def installed(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self))
+            yield self
+
+
+def _describe(repeated):
+    return "\n".join(f"  {count} × {key}\n    из {place}"
+                     for key, count, place in repeated)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries=None, max_repeats=None):
+    """
+    Падает с QueryBudgetExceeded, если в блоке выполнено больше max_queries
+    запросов или какой-то отпечаток повторился больше max_repeats раз.
+    """
+    inspector = QueryInspector()
+    with inspector.installed():
+        yield inspector
+    problems = []
+    if max_queries is not None and inspector.count > max_queries:
+        problems.append(f"{inspector.count} запросов при бюджете "
+                        f"{max_queries}")
+    if max_repeats is not None:
+        repeated = inspector.repeated(max_repeats + 1)
+        if repeated:
+            problems.append(f"повторы больше {max_repeats} раз:\n"
+                            + _describe(repeated))
+    if problems:
+        repeated = inspector.repeated(2)
+        if repeated and max_repeats is None:
+            problems.append("повторяющиеся запросы:\n" + _describe(repeated))
+        raise QueryBudgetExceeded("\n".join(problems))
+
+
+class QueryInspectorMiddleware:
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspector = QueryInspector(settings.QUERY_REPEAT_THRESHOLD,
+                                   settings.SLOW_QUERY_MS)
+        with inspector.installed():
+            response = self.get_response(request)
+        repeated = inspector.repeated()
+        if repeated:
+            logger.warning("Возможный N+1 в %s (%s запросов):\n%s",
+                           request.path, inspector.count,
+                           _describe(repeated))
+        return response
@@ -0,0 +1,78 @@
+"""
+Маршрутизация чтения на реплики.
+
+ReplicaRoutingMiddleware выбирает реплику для GET/HEAD-запросов к
+представлениям из REPLICA_READ_VIEWS, и ReplicaRouter отправляет на неё все
+чтения этого запроса. Запись, сессии и всё остальное идут в default.
+
+Реплика может отставать, поэтому после записи (POST или любой запрос, во
+время которого что-то писалось в базу) браузер получает cookie
+REPLICA_STICKY_COOKIE на REPLICA_STICKY_SECONDS секунд, и пока она есть,
+его запросы читают из default: пользователь сразу видит свои изменения.
+
+Без DATABASE_REPLICAS всё работает с default, как раньше.
+"""
+import random
+import threading
+
+from django.conf import settings
+
+# Приложения, которые всегда читаются из default
+PRIMARY_ONLY_APPS = {"sessions"}
+
+_state = threading.local()
+
+
+def current_replica():
+    """Реплика, выбранная для текущего запроса, или None."""
+    return getattr(_state, "replica", None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = current_replica()
+        if replica and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            return replica
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in PRIMARY_ONLY_APPS:
+            _state.wrote = True
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default, объекты из них можно смешивать
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica = None
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _state.wrote
+            _state.replica = None
+            _state.wrote = False
+        if settings.DATABASE_REPLICAS and (
+                wrote or request.method not in ("GET", "HEAD", "OPTIONS")):
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE, "1",
+                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (settings.DATABASE_REPLICAS
+                and request.method in ("GET", "HEAD")
+                and request.resolver_match.url_name
+                in settings.REPLICA_READ_VIEWS
+                and settings.REPLICA_STICKY_COOKIE not in request.COOKIES):
+            _state.replica = random.choice(settings.DATABASE_REPLICAS)
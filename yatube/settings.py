@@ -56,11 +56,14 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.querylog.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     #'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -70,7 +73,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "yatube.metrics.TimedTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -94,7 +97,9 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': os.environ.get(
+            'YATUBE_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
     }
 }
 
@@ -154,12 +159,145 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 # Идентификатор текущего сайта
 SITE_ID = 1
 
-CACHES = {
-    'default': {
+# Кэш: locmem — свой в каждом процессе (для разработки и тестов),
+# sqlite — общий для всех воркеров файл (yatube/sqlite_cache.py).
+# Выбирается переменной YATUBE_CACHE.
+CACHE_PROFILES = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_FREQUENCY': 10},
+    },
+}
+CACHES = {
+    'default': CACHE_PROFILES[os.environ.get('YATUBE_CACHE', 'locmem')],
 }
 
+# ETag и 304 на страницы (posts/cache.py) строятся из версий в кэше и
+# верны, только если кэш общий для всех процессов
+PAGE_ETAGS = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
+
+# Курсорная пагинация лент (?after=/?before=) вместо номеров страниц
+POSTS_CURSOR_PAGINATION = False
+
+# Время жизни закэшированных карточек постов (includes/post_item.html)
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Версионированный кэш страниц (posts/cache.py): время жизни страницы,
+# время блокировки на перестроение и сколько ждать чужое перестроение
+PAGE_CACHE_TIMEOUT = 60 * 5
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_LOCK_WAIT = 2
+
+# Число потоков фоновой генерации миниатюр (0 — строить сразу после коммита)
+THUMBNAIL_WORKERS = 2
+
+# Ширины адаптивных вариантов картинок постов (WebP и JPEG)
+POST_IMAGE_WIDTHS = [320, 640, 960, 1920]
+
+# Загрузки пишутся во временный файл с ограничением размера
+# (posts/uploadhandlers.py); картинки постов проверяются по заголовку и
+# уменьшаются до POST_IMAGE_MAX_DIMENSION пикселей по большей стороне
+FILE_UPLOAD_HANDLERS = ["posts.uploadhandlers.SizeLimitedUploadHandler"]
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40_000_000
+POST_IMAGE_MAX_DIMENSION = 2560
+
+# Сколько самых релевантных постов возвращает поиск (posts/search.py)
+SEARCH_MAX_RESULTS = 1000
+
+# Комментариев на странице поста; остальные подгружаются по курсору
+COMMENTS_PER_PAGE = 20
+
+# Размер страницы JSON API (/api/v1/)
+API_PAGE_SIZE = 20
+
+# Реплики для чтения (yatube/routers.py): пути к файлам SQLite через запятую
+# в YATUBE_REPLICA_DB_NAMES. Локально реплики — копии основной базы, их
+# обновляет команда sync_replicas.
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get(
+        "YATUBE_REPLICA_DB_NAMES", "").split(","))):
+    DATABASES[f"replica{number}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": name.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["yatube.routers.ReplicaRouter"]
+# Представления (url_name), которые читают с реплик
+REPLICA_READ_VIEWS = ["index", "group_posts", "profile", "post",
+                      "follow_index", "post_comments", "search", "trending"]
+# Сколько секунд после записи браузер читает из основной базы
+REPLICA_STICKY_COOKIE = "primary_until"
+REPLICA_STICKY_SECONDS = 10
+
+# Профили соединений с SQLite (yatube/sqlite.py), выбираются переменной
+# YATUBE_DB_PROFILE. production: WAL, synchronous=NORMAL, mmap 256 МБ,
+# кэш страниц 64 МБ и постоянные соединения.
+SQLITE_PROFILES = {
+    "default": {"CONN_MAX_AGE": 0, "PRAGMAS": {}},
+    "production": {
+        "CONN_MAX_AGE": 600,
+        "PRAGMAS": {
+            "journal_mode": "wal",
+            "synchronous": "normal",
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -64 * 1024,
+            "temp_store": "memory",
+        },
+    },
+}
+DB_PROFILE = os.environ.get("YATUBE_DB_PROFILE", "default")
+for database in DATABASES.values():
+    database["CONN_MAX_AGE"] = SQLITE_PROFILES[DB_PROFILE]["CONN_MAX_AGE"]
+
+# Метрики запросов (yatube/metrics.py): гистограммы по имени URL на
+# /metrics/ (для персонала и с токеном METRICS_TOKEN) и заголовок
+# Server-Timing на всех ответах (только для нагрузочных тестов)
+METRICS_ENABLED = True
+METRICS_SERVER_TIMING = False
+METRICS_TOKEN = os.environ.get("YATUBE_METRICS_TOKEN", "")
+
+# Журнал запросов (yatube/querylog.py): в лог yatube.queries пишутся
+# запросы дольше SLOW_QUERY_MS и отпечатки, повторённые за один запрос
+# к сайту QUERY_REPEAT_THRESHOLD раз и больше (N+1)
+QUERY_INSPECTOR_ENABLED = True
+SLOW_QUERY_MS = 100
+QUERY_REPEAT_THRESHOLD = 5
+
+# Подписки пачкой (posts/follows.py) и рекомендации «на кого подписаться»
+# (posts/suggestions.py, пересчёт командой compute_suggestions)
+FOLLOW_BULK_LIMIT = 100
+SUGGESTIONS_PER_USER = 20
+
+# Популярное (posts/trending.py, пересчёт командой compute_trending): вес
+# активности затухает вдвое за TRENDING_HALF_LIFE_HOURS, строки с весом
+# ниже TRENDING_MIN_SCORE удаляются, на странице TRENDING_SIZE постов
+TRENDING_HALF_LIFE_HOURS = 6
+TRENDING_MIN_SCORE = 0.01
+TRENDING_SIZE = 20
+
+# Отложенная запись комментариев (posts/comment_writer.py): журнал,
+# очередь на COMMENT_QUEUE_SIZE комментариев (дольше COMMENT_QUEUE_TIMEOUT
+# секунд не ждём — 503) и вставка пачками до COMMENT_BATCH_SIZE раз в
+# COMMENT_FLUSH_MS миллисекунд
+COMMENT_WRITE_BEHIND = os.environ.get("YATUBE_COMMENT_WRITE_BEHIND") == "1"
+COMMENT_JOURNAL = os.path.join(BASE_DIR, "comments.journal")
+COMMENT_JOURNAL_FSYNC = True
+COMMENT_QUEUE_SIZE = 1000
+COMMENT_QUEUE_TIMEOUT = 2
+COMMENT_BATCH_SIZE = 200
+COMMENT_FLUSH_MS = 50
@@ -0,0 +1,26 @@
+"""
+Настройка соединений SQLite по профилю базы.
+
+Профиль выбирается переменной окружения YATUBE_DB_PROFILE (см.
+SQLITE_PROFILES в settings.py). Профиль production включает WAL, чтобы
+читатели не ждали писателей, synchronous=NORMAL (в режиме WAL безопасно
+при сбое процесса), mmap и увеличенный кэш страниц, а соединения живут
+между запросами (CONN_MAX_AGE).
+"""
+from django.conf import settings
+
+
+def profile_pragmas(profile=None):
+    return settings.SQLITE_PROFILES[profile or settings.DB_PROFILE]["PRAGMAS"]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Обработчик connection_created: выставляет PRAGMA профиля."""
+    if connection.vendor != "sqlite":
+        return
+    pragmas = profile_pragmas()
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,241 @@
+"""
+Кэш в файле SQLite, общий для всех процессов сервера.
+
+В отличие от LocMemCache, все воркеры видят одни и те же записи: сброс
+версии страницы в одном процессе сразу виден остальным, а память не
+растёт с числом воркеров. Внешний сервис не нужен.
+
+Каждая операция — одна транзакция SQLite, поэтому запись атомарна, а add и
+incr атомарны и между процессами (на них держатся блокировки перестроения
+страниц и версии областей). Целые числа хранятся как INTEGER, остальное —
+pickle. Запросы обходятся без UPSERT и RETURNING, чтобы бэкенд работал и
+со старыми сборками SQLite (до 3.24). При превышении MAX_ENTRIES
+вытесняются записи, которые дольше всего не читали (LRU). Время
+последнего чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд,
+чтобы чтение почти никогда не писало в базу.
+
+Настройка:
+
+    CACHES = {"default": {
+        "BACKEND": "yatube.sqlite_cache.SQLiteCache",
+        "LOCATION": "/var/tmp/yatube-cache.sqlite3",
+        "OPTIONS": {"MAX_ENTRIES": 100000, "CULL_FREQUENCY": 10},
+    }}
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+ACCESS_RESOLUTION = 30
+CULL_CHECK_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+"""
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+        self._sets = 0
+
+    @property
+    def _db(self):
+        """Соединение текущего потока; после fork открывается заново."""
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            db = sqlite3.connect(self.location, timeout=10,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode = wal")
+            db.execute("PRAGMA synchronous = normal")
+            db.execute("PRAGMA mmap_size = 268435456")
+            db.executescript(SCHEMA)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fresh(self, expires, now):
+        return expires is None or expires > now
+
+    def _touch_accessed(self, keys, now):
+        self._db.execute(
+            "UPDATE cache SET accessed = ? WHERE accessed < ? AND key IN (%s)"
+            % ", ".join("?" * len(keys)),
+            [now, now - ACCESS_RESOLUTION, *keys],
+        )
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        if not keys:
+            return {}
+        names = {self._key(key, version): key for key in keys}
+        now = time.time()
+        rows = self._db.execute(
+            "SELECT key, value, expires, accessed FROM cache "
+            "WHERE key IN (%s)" % ", ".join("?" * len(names)),
+            list(names),
+        ).fetchall()
+        result, stale = {}, []
+        for name, value, expires, accessed in rows:
+            if self._fresh(expires, now):
+                result[names[name]] = self._load(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append(name)
+        if stale:
+            self._touch_accessed(stale, now)
+        return result
+
+    def has_key(self, key, version=None):
+        row = self._db.execute(
+            "SELECT expires FROM cache WHERE key = ?",
+            [self._key(key, version)],
+        ).fetchone()
+        return row is not None and self._fresh(row[0], time.time())
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [(self._key(key, version), self._dump(value), expires, now)
+                for key, value in data.items()]
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+                "VALUES (?, ?, ?, ?)", rows,
+            )
+            self._sets += len(rows)
+            if self._sets >= CULL_CHECK_EVERY:
+                self._sets = 0
+                self._cull(now)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """Записывает значение, только если ключа нет или он истёк."""
+        name = self._key(key, version)
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT expires FROM cache WHERE key = ?",
+                             [name]).fetchone()
+            added = row is None or not self._fresh(row[0], now)
+            if added:
+                db.execute(
+                    "INSERT OR REPLACE INTO cache "
+                    "(key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                    [name, self._dump(value),
+                     self.get_backend_timeout(timeout), now],
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        name = self._key(key, version)
+        now = time.time()
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            # UPDATE и SELECT в одной транзакции с блокировкой записи:
+            # между ними значение никто не изменит
+            row = None
+            if db.execute(
+                    "UPDATE cache SET value = value + ? WHERE key = ? "
+                    "AND typeof(value) = 'integer' "
+                    "AND (expires IS NULL OR expires > ?)",
+                    [delta, name, now]).rowcount:
+                row = db.execute("SELECT value FROM cache WHERE key = ?",
+                                 [name]).fetchone()
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._db.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            [self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()],
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        if names:
+            self._db.execute(
+                "DELETE FROM cache WHERE key IN (%s)"
+                % ", ".join("?" * len(names)), names,
+            )
+
+    def clear(self):
+        self._db.execute("DELETE FROM cache")
+
+    def _cull(self, now):
+        """Удаляет истёкшие записи, затем самые давно читанные (LRU)."""
+        db = self._db
+        db.execute("DELETE FROM cache WHERE expires <= ?", [now])
+        count = db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self._max_entries:
+            excess = count - self._max_entries
+            if self._cull_frequency:
+                excess = max(excess, count // self._cull_frequency)
+            db.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "ORDER BY accessed LIMIT ?)", [excess],
+            )
+
+    def close(self, **kwargs):
+        # Соединение живёт весь процесс: закрывать его после каждого
+        # запроса (сигнал request_finished) незачем
+        pass
@@ -20,11 +20,14 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from yatube import metrics
+
 urlpatterns = [
         path('about/', include('django.contrib.flatpages.urls')),
         path('auth/', include('users.urls')),
         path('auth/', include('django.contrib.auth.urls')),
         path('admin/', admin.site.urls),
+        path('metrics/', metrics.metrics_view, name='metrics'),
 ]
 
 urlpatterns += [
@@ -35,6 +38,7 @@ urlpatterns += [
 ]
 
 urlpatterns += [
+    path('api/v1/', include('posts.api_urls')),
     path('', include('posts.urls')),
 ]
 